@@ -0,0 +1,182 @@
+''' Microbenchmarks for the hot paths of the state classes, heuristics and solvers. Every benchmark runs on a fixed
+corpus built from fixed seeds, so two runs on the same machine time the same work. Results are written as JSON and can
+be compared against a stored baseline:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.1
+
+The comparison exits with status 1 if any benchmark got slower than the baseline by more than the threshold, or if a
+solver benchmark's check value (e.g. nodes generated) changed, since then the two runs did not do the same work. '''
+
+import json
+import platform
+import random
+import sys
+from argparse import ArgumentParser
+from timeit import Timer
+
+
+CORPUS_SEED = 20180101
+
+
+def queens_corpus(count=20):
+    from queens import QueensState
+    rng = random.Random(CORPUS_SEED)
+    return [QueensState([(col, rng.randrange(8)) for col in range(8)]) for _ in range(count)]
+
+
+def puzzle_corpus(count=10, walk_length=40):
+    ''' Returns (start, goal) sequences of 8-puzzles made by random walks away from the goal '''
+    from puzzle import PuzzleState
+    rng = random.Random(CORPUS_SEED)
+    goal = list(range(1, 10))
+    instances = []
+    for _ in range(count):
+        state = PuzzleState(goal)
+        for _ in range(walk_length):
+            state = rng.choice(state.get_children())
+        instances.append((state.sequence, goal))
+    return instances
+
+
+def state_benchmarks():
+    from puzzle import PuzzleState, h_manhattan, h_manhattan_batch
+    from queens import QueensState, h_distinct_attacks
+    boards = queens_corpus()
+    sequences = [start for start, _ in puzzle_corpus()]
+    states = [PuzzleState(sequence) for sequence in sequences]
+    goal = PuzzleState(list(range(1, 10)))
+
+    def seeded(function):
+        # States whose methods draw random numbers are benchmarked from the same seed every time
+        def run():
+            random.seed(CORPUS_SEED)
+            return function()
+        return run
+
+    return {
+        'queens_get_children': lambda: [board.get_children() for board in boards],
+        'queens_queen_attacks': lambda: [board.queen_attacks() for board in boards],
+        'queens_random_child': seeded(lambda: [board.random_child() for board in boards]),
+        # Built from the positions each time, so the lines are not cached from an earlier call
+        'queens_h_distinct_attacks': lambda: [h_distinct_attacks(QueensState(board.queen_positions))
+                                              for board in boards],
+        'puzzle_init': lambda: [PuzzleState(sequence) for sequence in sequences],
+        'puzzle_get_children': lambda: [state.get_children() for state in states],
+        'h_manhattan': lambda: [h_manhattan(state, goal) for state in states],
+        'h_manhattan_batch': lambda: h_manhattan_batch(states, goal),
+    }
+
+
+def solver_benchmarks():
+    ''' Each benchmark returns a check value that depends only on the work done, such as total nodes generated '''
+    from queens import QueensProblem, h_distinct_attacks
+    from puzzle import PuzzleProblem
+    from search import astar, steepest_ascent_hill_climb
+
+    boards = queens_corpus(3)
+    instances = puzzle_corpus()
+
+    def puzzle_astar():
+        return sum(astar(PuzzleProblem(start_state=list(start), goal_state=list(goal)))['total_nodes']
+                   for start, goal in instances)
+
+    def puzzle_steepest():
+        random.seed(CORPUS_SEED)
+        return sum(len(steepest_ascent_hill_climb(PuzzleProblem(start_state=list(start), goal_state=list(goal)))[
+            'solution']) for start, goal in instances)
+
+    def queens_astar():
+        return sum(astar(QueensProblem(board))['total_nodes'] for board in boards)
+
+    def queens_steepest(cost_function=None):
+        random.seed(CORPUS_SEED)
+        options = {'cost_function': cost_function} if cost_function else {}
+        return sum(len(steepest_ascent_hill_climb(QueensProblem(board, **options), allow_sideways=True)['solution'])
+                   for board in queens_corpus(5))
+
+    return {
+        'puzzle_astar': puzzle_astar,
+        'puzzle_steepest_ascent': puzzle_steepest,
+        'queens_astar': queens_astar,
+        'queens_steepest_ascent_sideways': queens_steepest,
+        'queens_steepest_distinct_attacks': lambda: queens_steepest(h_distinct_attacks),
+    }
+
+
+def run_benchmark(function, repeat=5, min_time=0.2):
+    ''' Returns the best and median time per call in microseconds over repeat rounds of at least min_time seconds '''
+    timer = Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = sorted(time / number * 1e6 for time in timer.repeat(repeat, number))
+    return {'best_us': times[0], 'median_us': times[len(times)//2], 'calls': number}
+
+
+def run_benchmarks(name_filter=None, repeat=5, min_time=0.2):
+    benchmarks = dict(state_benchmarks())
+    benchmarks.update({name: (function, True) for name, function in solver_benchmarks().items()})
+
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if name_filter and name_filter not in name:
+            continue
+        function, checked = benchmark if isinstance(benchmark, tuple) else (benchmark, False)
+        print(('Running ' + name + '...').ljust(50), end='', flush=True, file=sys.stderr)
+        result = run_benchmark(function, repeat, min_time)
+        if checked:
+            result['check'] = function()
+        results[name] = result
+        print('{best_us:>12.1f} us'.format(**result), file=sys.stderr)
+
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'corpus_seed': CORPUS_SEED,
+            'benchmarks': results}
+
+
+def compare(baseline, current, threshold):
+    ''' Prints each benchmark's change against the baseline and returns the names of those that regressed '''
+    regressions = []
+    print('Benchmark'.rjust(35) + '    ' + 'Baseline'.ljust(15) + 'Current'.ljust(15) + 'Change'.ljust(10))
+    for name, result in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print(name.rjust(35) + '    (not in baseline)')
+            continue
+        before = baseline['benchmarks'][name]
+        change = result['best_us'] / before['best_us'] - 1
+        note = ''
+        if before.get('check') != result.get('check'):
+            note = 'check value changed from ' + str(before.get('check')) + ' to ' + str(result.get('check'))
+            regressions.append(name)
+        elif change > threshold:
+            note = 'REGRESSION'
+            regressions.append(name)
+        print('{name:>35}    {before:<15.1f}{after:<15.1f}{change:<+10.1%}{note}'.format(
+            name=name, before=before['best_us'], after=result['best_us'], change=change, note=note))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Run the microbenchmarks and optionally compare them against a baseline.')
+    parser.add_argument('--output', help='write the results as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fractional slowdown against the baseline that counts as a regression')
+    parser.add_argument('--filter', dest='name_filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timing round')
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.name_filter, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+    elif not args.baseline:
+        print(json.dumps(current, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(json.load(file), current, args.threshold)
+        if regressions:
+            print('\n' + str(len(regressions)) + ' regression(s): ' + ', '.join(regressions))
+            sys.exit(1)
@@ -0,0 +1,53 @@
+import json
+import sqlite3
+from threading import Lock
+
+
+class SolutionCache:
+    ''' Persistent store of solved paths, keyed on the solver name and the canonical form of the instance.
+    Problems provide canonical_key(), encode_path() and decode_path(), so one cached solution answers every
+    relabeling or symmetric copy of an instance. The oldest entries are evicted once max_entries is exceeded. One
+    connection is shared by the threads that use the cache (e.g. through solve_many), taking turns under a lock. '''
+
+    def __init__(self, filename='solution_cache.sqlite', max_entries=100000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        self.connection = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS solutions (id INTEGER PRIMARY KEY, solver TEXT NOT NULL, '
+                                'key TEXT NOT NULL, path TEXT NOT NULL, stats TEXT NOT NULL, UNIQUE (solver, key))')
+
+    def lookup(self, solver, problem):
+        ''' Returns (path, stats) for a cached solution of problem mapped back onto its own labeling, or None '''
+        key = problem.canonical_key()
+        with self.lock:
+            row = self.connection.execute('SELECT path, stats FROM solutions WHERE solver = ? AND key = ?',
+                                          (solver, key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return problem.decode_path(json.loads(row[0])), json.loads(row[1])
+
+    def store(self, solver, problem, path, stats=None):
+        row = (solver, problem.canonical_key(), json.dumps(problem.encode_path(path)), json.dumps(stats or {}))
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO solutions (solver, key, path, stats) VALUES (?, ?, ?, ?)',
+                                    row)
+            self.connection.execute('DELETE FROM solutions WHERE id <= (SELECT MAX(id) FROM solutions) - ?',
+                                    (self.max_entries,))
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM solutions')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,251 @@
+''' Coordinator and workers for running a sweep on several machines. The coordinator serves a TaskBoard over TCP with
+multiprocessing.managers; workers on any host lease batches of tasks from it, solve them and hand back the results.
+A lease that is neither completed nor renewed within lease_time (e.g. because its worker died or lost its connection)
+is put back for another worker, up to max_attempts times per batch.
+
+Tasks and results are opaque to this module: tasks must be picklable and the worker's solve function turns one task
+into one result. Everything can be tried on one machine by starting the workers as local processes, e.g.
+
+    python simulations.py sweep --serve 127.0.0.1:50000 --workers 4 ...     (coordinator with 4 local workers)
+    python simulations.py worker --connect 127.0.0.1:50000                   (another worker, from any host) '''
+
+import ipaddress
+import threading
+from collections import deque
+from multiprocessing import Pool, Process
+from multiprocessing.managers import BaseManager
+from queue import Empty, Queue
+from time import sleep
+from timeit import default_timer as timer
+
+
+class TaskBoard:
+    ''' Coordinator state shared with the workers: batches waiting to be leased, leases held, and finished results.
+    Worker calls arrive on the manager's threads, so every method holds the lock. '''
+
+    def __init__(self, tasks, batch_size=8, lease_time=60, max_attempts=3):
+        self.lock = threading.Lock()
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        tasks = list(enumerate(tasks))
+        self.batches = {batch_id: tasks[start:start+batch_size]
+                        for batch_id, start in enumerate(range(0, len(tasks), batch_size))}
+        self.attempts = {batch_id: 0 for batch_id in self.batches}
+        self.pending = deque(self.batches)
+        self.leases = {}      # batch id -> (worker, deadline)
+        self.finished = Queue()
+        self.unresolved = len(self.batches)
+        self.dropped = []
+
+    def reclaim(self):
+        ''' Puts batches whose lease has run out back in the queue, or drops them after max_attempts '''
+        with self.lock:
+            now = timer()
+            for batch_id, (worker, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    del self.leases[batch_id]
+                    self.retry(batch_id, 'lease held by ' + worker + ' expired')
+
+    def retry(self, batch_id, error):
+        if self.attempts[batch_id] < self.max_attempts:
+            self.pending.append(batch_id)
+        else:
+            # Forgetting the batch makes a late complete() from the worker that lost the lease a no-op, so the batch
+            # is not resolved twice
+            del self.batches[batch_id]
+            self.dropped.append((batch_id, error))
+            self.unresolved -= 1
+            self.finished.put(None)
+
+    def lease(self, worker):
+        ''' Returns (batch id, [(task index, task)]) to solve, None if nothing is free right now, or 'done' once every
+        batch is resolved '''
+        self.reclaim()
+        with self.lock:
+            if not self.unresolved:
+                return 'done'
+            if not self.pending:
+                return None
+            batch_id = self.pending.popleft()
+            self.attempts[batch_id] += 1
+            self.leases[batch_id] = (worker, timer() + self.lease_time)
+            return batch_id, self.batches[batch_id]
+
+    def renew(self, worker, batch_id):
+        ''' Extends a lease; returns False if the lease was lost, in which case the batch may be solved elsewhere '''
+        with self.lock:
+            if self.leases.get(batch_id, (None,))[0] != worker:
+                return False
+            self.leases[batch_id] = (worker, timer() + self.lease_time)
+            return True
+
+    def complete(self, worker, batch_id, results):
+        ''' Accepts [(task index, result)] for a batch. Results for a batch that was already completed by another
+        worker, after this worker's lease ran out, are ignored. '''
+        with self.lock:
+            if batch_id not in self.batches:
+                return
+            self.leases.pop(batch_id, None)
+            if batch_id in self.pending:
+                self.pending.remove(batch_id)
+            del self.batches[batch_id]
+            self.unresolved -= 1
+            self.finished.put(results)
+
+    def fail(self, worker, batch_id, error):
+        with self.lock:
+            if self.leases.get(batch_id, (None,))[0] == worker:
+                del self.leases[batch_id]
+                self.retry(batch_id, worker + ': ' + error)
+
+
+class BoardManager(BaseManager):
+    pass
+
+
+def parse_address(address):
+    ''' Turns 'host:port' into (host, port) '''
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+# Key used when none is given, accepted for loopback addresses only: the manager unpickles what it receives, so anyone
+# who knows the key can run code on the coordinator
+DEFAULT_AUTHKEY = 'search'
+
+
+def check_authkey(address, authkey):
+    ''' Returns authkey, or DEFAULT_AUTHKEY if it is None and address is on the loopback interface '''
+    if authkey is not None:
+        return authkey
+    host = parse_address(address)[0]
+    try:
+        loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError('An explicit authkey is required for ' + address + ', which is not a loopback address')
+    return DEFAULT_AUTHKEY
+
+
+def coordinate(tasks, address, authkey=None, batch_size=8, lease_time=60, max_attempts=3, local_workers=0, solve=None,
+               processes=1):
+    ''' Serves tasks at address and yields (task index, result) as workers complete them, in no particular order.
+    With local_workers, starts that many worker processes on this machine, solving with solve. Tasks whose batch was
+    dropped after max_attempts are not yielded; they are listed with the error that ended the last attempt in the
+    dropped attribute of the board, which the generator prints at the end. '''
+
+    authkey = check_authkey(address, authkey)
+    board = TaskBoard(tasks, batch_size, lease_time, max_attempts)
+    BoardManager.register('board', callable=lambda: board)
+    manager = BoardManager(address=parse_address(address), authkey=authkey.encode())
+    server = manager.get_server()
+
+    def serve():
+        # serve_forever ends with sys.exit once stop_event is set, as it expects to own its process
+        try:
+            server.serve_forever()
+        except SystemExit:
+            pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    print('Coordinator serving ' + str(board.unresolved) + ' batches on ' + address, flush=True)
+
+    # Not daemonic, since a worker with processes > 1 starts a Pool of its own
+    workers = [Process(target=run_worker, args=(address, authkey, solve, processes, 'local-' + str(index)))
+               for index in range(local_workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        resolved = 0
+        total = board.unresolved
+        while resolved < total:
+            try:
+                results = board.finished.get(timeout=1)
+            except Empty:
+                board.reclaim()
+                # Without local workers or leases left, nothing would ever arrive or expire
+                if workers and not any(worker.is_alive() for worker in workers) and not board.leases:
+                    raise RuntimeError('Every local worker exited with ' + str(board.unresolved) +
+                                       ' batches unresolved (exit codes ' +
+                                       str([worker.exitcode for worker in workers]) + ')')
+                continue
+            resolved += 1
+            for result in results or []:
+                yield result
+
+        for batch_id, error in board.dropped:
+            print('\nDropped batch ' + str(batch_id) + ' after ' + str(max_attempts) + ' attempts: ' + error)
+        # Give the workers a moment to be told that the sweep is done before the server goes away
+        for worker in workers:
+            worker.join(timeout=lease_time)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        server.stop_event.set()
+
+
+def run_worker(address, authkey, solve, processes=1, name=None, poll_interval=0.5, renew_interval=5,
+               connect_attempts=20):
+    ''' Leases batches from the coordinator at address and solves them with solve(task) in processes local processes,
+    until the coordinator reports that every batch is resolved or goes away. A background thread renews the lease
+    every renew_interval seconds while a batch is being solved, so renew_interval must be well below the
+    coordinator's lease_time. '''
+
+    import os
+    import socket
+    name = name or socket.gethostname() + ':' + str(os.getpid())
+    authkey = check_authkey(address, authkey)
+
+    BoardManager.register('board')
+    manager = BoardManager(address=parse_address(address), authkey=authkey.encode())
+    for attempt in range(connect_attempts):
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if attempt == connect_attempts - 1:
+                raise
+            sleep(poll_interval)
+    board = manager.board()
+
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        while True:
+            try:
+                lease = board.lease(name)
+            except (EOFError, ConnectionError):
+                return
+            if lease == 'done':
+                return
+            if lease is None:
+                sleep(poll_interval)
+                continue
+
+            batch_id, batch = lease
+            finished = threading.Event()
+
+            def renew_lease():
+                # Proxies open a connection per thread, so this does not interleave with the main thread's calls
+                while not finished.wait(renew_interval):
+                    if not board.renew(name, batch_id):
+                        return
+
+            renewer = threading.Thread(target=renew_lease, daemon=True)
+            renewer.start()
+            try:
+                tasks = [task for _, task in batch]
+                results = pool.map(solve, tasks) if pool else [solve(task) for task in tasks]
+            except Exception as error:
+                board.fail(name, batch_id, repr(error))
+                continue
+            finally:
+                finished.set()
+                renewer.join()
+            board.complete(name, batch_id, [(index, result) for (index, _), result in zip(batch, results)])
+    finally:
+        if pool:
+            pool.close()
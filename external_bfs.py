@@ -0,0 +1,268 @@
+''' Breadth-first search of the sliding puzzle on disk, for sampling problems whose optimal solution length is known
+exactly on boards too large to search in memory, such as the 15-puzzle. States are packed into 64-bit ints
+(PuzzleState.pack) and every BFS layer is a file of them in sorted order. Layer d+1 is made by expanding layer d in
+chunks, sorting each chunk of run_size children into a run file, then merging the runs while dropping repeats and the
+states of layers d and d-1. Those are the only layers a move from layer d can reach, so memory stays bounded by
+run_size whatever the layer sizes, and only three layers are on disk at a time. Sampled layers feed the columnar store
+that make_problem_set reads:
+
+    python external_bfs.py --shape 4 4 --max-depth 24 --samples 100 --output sample_15puzzle_problems
+
+Layers grow about twice as large per depth on the 15-puzzle, so the depth reached is bounded by time and disk rather
+than memory: a layer costs 8 bytes per state on disk, plus about as much again in runs while the next one is made, and
+CPython gets through around 150,000 states a second. Depth 20 (1.6 million states) takes seconds and depth 24 minutes;
+depth 30, with around a billion states in the last layer, takes hours and tens of gigabytes. '''
+
+import os
+from array import array
+from heapq import merge
+from random import Random
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+from puzzle import PuzzleState, neighbour_table
+
+
+def layer_path(directory, depth):
+    return os.path.join(directory, 'layer-' + str(depth) + '.bin')
+
+
+def read_states(path, chunk_size=1 << 16):
+    ''' Yields the packed states stored in path, reading chunk_size of them at a time '''
+    with open(path, 'rb') as file:
+        while True:
+            chunk = array('Q')
+            try:
+                chunk.fromfile(file, chunk_size)
+            except EOFError:
+                # fromfile keeps the states it could read before the end of the file
+                yield from chunk
+                return
+            yield from chunk
+
+
+class StateWriter:
+    ''' Appends packed states to a file through a buffer of chunk_size states '''
+
+    def __init__(self, path, chunk_size=1 << 16):
+        self.file = open(path, 'wb')
+        self.chunk_size = chunk_size
+        self.buffer = array('Q')
+        self.count = 0
+
+    def write(self, state):
+        self.buffer.append(state)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.buffer.tofile(self.file)
+        self.count += len(self.buffer)
+        self.buffer = array('Q')
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def unique(states):
+    ''' Drops repeats from sorted states '''
+    previous = None
+    for state in states:
+        if state != previous:
+            yield state
+            previous = state
+
+
+def subtract(states, excluded):
+    ''' Yields the sorted states that are not in the sorted stream excluded '''
+    excluded = iter(excluded)
+    current = next(excluded, None)
+    for state in states:
+        while current is not None and current < state:
+            current = next(excluded, None)
+        if state != current:
+            yield state
+
+
+def merge_runs(paths, directory, chunk_size, max_open=256):
+    ''' Returns paths merged down to at most max_open sorted runs, merging max_open at a time, so the final merge never
+    holds more files open than that '''
+    generation = 0
+    while len(paths) > max_open:
+        merged = []
+        for start in range(0, len(paths), max_open):
+            group = paths[start:start+max_open]
+            path = os.path.join(directory, 'merged-' + str(generation) + '-' + str(start) + '.bin')
+            writer = StateWriter(path, chunk_size)
+            for state in unique(merge(*[read_states(run, chunk_size) for run in group])):
+                writer.write(state)
+            writer.close()
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        paths = merged
+        generation += 1
+    return paths
+
+
+def move_generator(shape):
+    ''' Returns a function from a packed state to its packed children. The children are made on the packed ints
+    directly: sliding the tile at cell n into the blank's cell e swaps two bit fields, which is one XOR. '''
+    cells = shape[0] * shape[1]
+    bits = (cells - 1).bit_length()
+    mask = (1 << bits) - 1
+    blank = cells - 1    # pack() stores tile - 1, and the blank is the highest tile
+    neighbours = neighbour_table(*shape)
+    field_pairs = [[(bits * neighbour, (1 << (bits * neighbour)) | (1 << (bits * empty))) for neighbour in moves]
+                   for empty, moves in enumerate(neighbours)]
+
+    if bits == 4:
+        # Each field is one hex digit, so the blank is found by a string search rather than a loop over the cells
+        blank_digit = format(blank, 'x')
+
+        def blank_cell(state):
+            return cells - 1 - format(state, '0' + str(cells) + 'x').index(blank_digit)
+    else:
+        def blank_cell(state):
+            for cell in range(cells):
+                if (state >> (bits * cell)) & mask == blank:
+                    return cell
+
+    def children(state):
+        return [state ^ (((state >> shift) & mask) ^ blank) * fields
+                for shift, fields in field_pairs[blank_cell(state)]]
+
+    return children
+
+
+def external_bfs(root, directory, max_depth, run_size=1 << 21, chunk_size=1 << 16, on_layer=None):
+    ''' Searches breadth-first from the PuzzleState root, writing layer d to layer_path(directory, d), and yields
+    (depth, path, count) for every layer written, starting with the root at depth 0. Stops after max_depth or when a
+    layer is empty. on_layer(depth) may return a callback that is called with every state of that layer as it is
+    written, in sorted order, e.g. to sample the layer. Layers older than the last two are deleted as the search
+    moves past them. '''
+
+    if root.packed_bits() > 64:
+        raise ValueError('External BFS packs states into 64 bits, which ' + str(root.shape) + ' boards do not fit')
+    os.makedirs(directory, exist_ok=True)
+    children = move_generator(root.shape)
+
+    writer = StateWriter(layer_path(directory, 0), chunk_size)
+    writer.write(root.pack())
+    writer.close()
+    visit = on_layer(0) if on_layer else None
+    if visit:
+        visit(root.pack())
+    yield 0, layer_path(directory, 0), 1
+
+    for depth in range(1, max_depth + 1):
+        # Expand the last layer into sorted runs of at most run_size children
+        runs = []
+        buffer = []
+        for state in read_states(layer_path(directory, depth - 1), chunk_size):
+            buffer.extend(children(state))
+            if len(buffer) >= run_size:
+                runs.append(write_run(buffer, directory, depth, len(runs), chunk_size))
+                buffer = []
+        if buffer:
+            runs.append(write_run(buffer, directory, depth, len(runs), chunk_size))
+        runs = merge_runs(runs, directory, chunk_size)
+
+        # Children that are not in the two layers before them are the new layer
+        previous = [read_states(layer_path(directory, d), chunk_size) for d in (depth - 1, depth - 2) if d >= 0]
+        states = subtract(unique(merge(*[read_states(run, chunk_size) for run in runs])), merge(*previous))
+        visit = on_layer(depth) if on_layer else None
+        writer = StateWriter(layer_path(directory, depth), chunk_size)
+        for state in states:
+            writer.write(state)
+            if visit:
+                visit(state)
+        writer.close()
+
+        for run in runs:
+            os.remove(run)
+        if depth >= 2:
+            os.remove(layer_path(directory, depth - 2))
+        if not writer.count:
+            os.remove(layer_path(directory, depth))
+            return
+        yield depth, layer_path(directory, depth), writer.count
+
+
+def write_run(states, directory, depth, index, chunk_size):
+    path = os.path.join(directory, 'run-' + str(depth) + '-' + str(index) + '.bin')
+    writer = StateWriter(path, chunk_size)
+    for state in unique(sorted(states)):
+        writer.write(state)
+    writer.close()
+    return path
+
+
+class Reservoir:
+    ''' Keeps a uniform random sample of up to size of the values it is called with (Algorithm R) '''
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.values = []
+        self.seen = 0
+
+    def __call__(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            index = self.rng.randrange(self.seen)
+            if index < self.size:
+                self.values[index] = value
+
+
+def depth_samples(directory, shape=(4, 4), depths=tuple(range(2, 26, 2)), num_samples=100, seed=None, verbose=True,
+                  **kwargs):
+    ''' Returns num_samples {'start', 'end', 'depth'} problems per depth in depths, with the end the standard goal and
+    each start drawn uniformly from the states exactly depth moves from it, found by external_bfs in directory. The
+    layer files are removed afterwards. '''
+
+    goal = PuzzleState(list(range(1, shape[0] * shape[1] + 1)), shape=shape)
+    rng = Random(seed)
+    reservoirs = {depth: Reservoir(num_samples, rng) for depth in depths}
+    start_time = timer()
+    for depth, path, count in external_bfs(goal, directory, max(depths), on_layer=reservoirs.get, **kwargs):
+        if verbose:
+            print('Depth ' + str(depth) + ': ' + str(count) + ' states (' + str(round(timer() - start_time, 1)) +
+                  ' s)', flush=True)
+    for name in os.listdir(directory):
+        if name.startswith('layer-'):
+            os.remove(os.path.join(directory, name))
+
+    return [{'start': goal.unpack(state).sequence, 'end': goal.sequence, 'depth': depth}
+            for depth, reservoir in reservoirs.items() for state in reservoir.values]
+
+
+def default_directory(shape):
+    ''' The directory make_problem_set looks in for stored samples of shape boards '''
+    return 'sample_' + str(shape[0] * shape[1] - 1) + 'puzzle_problems'
+
+
+def export_depth_samples(output=None, work_directory='bfs_layers', shape=(4, 4), **kwargs):
+    ''' Samples problems with depth_samples and saves them as a PuzzleSet (see problemsets.py) in output '''
+    from problemsets import PuzzleSet
+    samples = PuzzleSet.from_samples(depth_samples(work_directory, shape, **kwargs), shape=shape)
+    samples.save(output or default_directory(shape))
+    return samples
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Sample sliding puzzles with known optimal solution lengths by breadth-first '
+                                        'search on disk.')
+    parser.add_argument('--shape', type=int, nargs=2, default=[4, 4], metavar=('ROWS', 'COLS'))
+    parser.add_argument('--max-depth', type=int, default=24, help='sample every even depth from 2 up to this')
+    parser.add_argument('--samples', type=int, default=100, help='problems per depth')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='directory of the saved set (default: the one make_problem_set reads)')
+    parser.add_argument('--work-dir', default='bfs_layers', help='directory for the layer and run files')
+    parser.add_argument('--run-size', type=int, default=1 << 21, help='children sorted in memory at a time')
+    args = parser.parse_args()
+
+    export_depth_samples(args.output, args.work_dir, tuple(args.shape), depths=tuple(range(2, args.max_depth + 1, 2)),
+                         num_samples=args.samples, seed=args.seed, run_size=args.run_size)
@@ -0,0 +1,94 @@
+''' Load generator for server.py. Sends random queens or puzzle instances over a number of concurrent connections and
+reports throughput and latency percentiles. '''
+
+import asyncio
+import json
+from argparse import ArgumentParser
+from random import randrange, seed
+from timeit import default_timer as timer
+
+
+def random_queens_request(request_id, algorithm):
+    return {'id': request_id, 'problem': 'queens', 'algorithm': algorithm,
+            'queens': [[col, randrange(8)] for col in range(8)]}
+
+
+def random_puzzle_request(request_id, algorithm, depth=16):
+    from puzzle import PuzzleState
+    goal = PuzzleState(list(range(1, 10)))
+    start = goal
+    for _ in range(depth):
+        start = start.random_child()
+    return {'id': request_id, 'problem': 'puzzle', 'algorithm': algorithm,
+            'start': start.sequence, 'goal': goal.sequence}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values)-1, int(fraction*len(sorted_values)))]
+
+
+async def run_connection(open_connection, requests, in_flight, latencies, outcomes):
+
+    reader, writer = await open_connection()
+    sent_at = {}
+    slots = asyncio.Semaphore(in_flight)
+
+    async def send():
+        for request in requests:
+            await slots.acquire()
+            sent_at[request['id']] = timer()
+            writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    for _ in range(len(requests)):
+        response = json.loads(await reader.readline())
+        latencies.append((timer()-sent_at.pop(response['id']))*1000)
+        outcomes[response['outcome']] = outcomes.get(response['outcome'], 0) + 1
+        slots.release()
+
+    await sender
+    writer.close()
+    await writer.wait_closed()
+
+
+async def generate_load(open_connection, requests, connections=8, in_flight=4):
+    latencies = []
+    outcomes = {}
+    start_time = timer()
+    await asyncio.gather(*[run_connection(open_connection, requests[index::connections], in_flight, latencies,
+                                          outcomes) for index in range(connections)])
+    elapsed = timer() - start_time
+
+    latencies.sort()
+    print('Requests:'.rjust(20) + '\t' + str(len(latencies)) + ' ' + str(outcomes))
+    print('Throughput:'.rjust(20) + '\t{:.1f} requests/s'.format(len(latencies) / elapsed))
+    print('p50 latency:'.rjust(20) + '\t{:.1f} ms'.format(percentile(latencies, 0.5)))
+    print('p99 latency:'.rjust(20) + '\t{:.1f} ms'.format(percentile(latencies, 0.99)))
+    print('Max latency:'.rjust(20) + '\t{:.1f} ms'.format(latencies[-1] if latencies else 0))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate solver load against a running server.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', dest='unix_path')
+    parser.add_argument('--problem', choices=['queens', 'puzzle'], default='queens')
+    parser.add_argument('--algorithm', default='steepest_ascent_hill_climb')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--in-flight', type=int, default=4, help='outstanding requests per connection')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    seed(args.seed)
+    make_request = random_queens_request if args.problem == 'queens' else random_puzzle_request
+    requests = [make_request(request_id, args.algorithm) for request_id in range(args.requests)]
+
+    if args.unix_path:
+        open_connection = lambda: asyncio.open_unix_connection(args.unix_path)
+    else:
+        open_connection = lambda: asyncio.open_connection(args.host, args.port)
+    asyncio.run(generate_load(open_connection, requests, args.connections, args.in_flight))
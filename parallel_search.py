@@ -0,0 +1,187 @@
+''' Hash-distributed A* (HDA*). Every worker process owns the states whose packed form hashes to it, keeps the open and
+closed lists for those states only, and sends each generated child to its owner in batches. A shared incumbent holds
+the cheapest solution found so far; workers only expand nodes with f below it, and the search stops once every worker
+is idle and every batch sent has been received. '''
+
+from heapq import heappop, heappush
+from math import inf
+from multiprocessing import Array, Process, Queue, Value
+from queue import Empty
+from time import sleep
+from search import batch_costs, unsolvable_result
+
+
+def owner(packed, processes):
+    ''' Assigns a packed state to a worker using the high bits of a multiplicative hash '''
+    return (((packed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % processes
+
+
+def hda_worker(index, problem, inboxes, results, replies, incumbent, goal_reports, sent, received, idle, batch_size,
+               expansions_per_poll):
+
+    processes = len(inboxes)
+    template = problem.start_state
+    inbox = inboxes[index]
+    frontier = []
+    path_costs = {}      # packed state -> (g, parent packed state)
+    outboxes = [[] for _ in range(processes)]
+    expansions = 0
+    generated = 0
+
+    def receive(entries):
+        for packed, g, h, parent in entries:
+            # Workers expand in different orders, so a state may be reached more cheaply after it was expanded and is
+            # then reopened
+            if path_costs.get(packed, (inf,))[0] <= g:
+                continue
+            path_costs[packed] = (g, parent)
+            heappush(frontier, (g+h, -g, packed))
+
+    def flush():
+        for destination, entries in enumerate(outboxes):
+            if entries:
+                sent[index] += 1
+                inboxes[destination].put(entries)
+                outboxes[destination] = []
+
+    while True:
+        try:
+            message = inbox.get(timeout=0.01) if idle[index] else inbox.get_nowait()
+        except Empty:
+            message = None
+
+        if message == 'stop':
+            break
+        if message is not None:
+            idle[index] = 0
+            receive(message)
+            received[index] += 1
+            continue
+
+        for _ in range(expansions_per_poll):
+            if not frontier or frontier[0][0] >= incumbent.value:
+                break
+            f, negative_g, packed = heappop(frontier)
+            g = -negative_g
+            if path_costs[packed][0] != g:
+                continue
+            expansions += 1
+
+            node = template.unpack(packed)
+            if problem.goal_test(node):
+                with incumbent.get_lock():
+                    if g < incumbent.value:
+                        incumbent.value = g
+                        goal_reports.value += 1
+                        results.put(('goal', g, packed))
+                continue
+
+            children = node.get_children()
+            generated += len(children)
+            for child, child_cost in zip(children, batch_costs(problem, children)):
+                child_packed = child.pack()
+                outboxes[owner(child_packed, processes)].append((child_packed, g+1, child_cost, packed))
+
+            # Children owned by this worker skip the queue; full batches for other workers are sent right away
+            receive(outboxes[index])
+            outboxes[index] = []
+            for destination, entries in enumerate(outboxes):
+                if len(entries) >= batch_size:
+                    sent[index] += 1
+                    inboxes[destination].put(entries)
+                    outboxes[destination] = []
+
+        flush()
+        if not frontier or frontier[0][0] >= incumbent.value:
+            idle[index] = 1
+
+    # After the search, answer parent lookups for path reconstruction until told to exit
+    while True:
+        message = inbox.get()
+        if message == 'exit':
+            results.put(('stats', index, expansions, generated))
+            return
+        replies.put(('parent', path_costs[message[1]][1]))
+
+
+def hda_star(problem, processes=4, batch_size=64, expansions_per_poll=100, poll_interval=0.005):
+    ''' Returns the same optimal solution cost as astar with an admissible, consistent heuristic. States must provide
+    pack() and unpack(packed); problems must be picklable. '''
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        rejected['total_nodes'] = 0
+        return rejected
+
+    inboxes = [Queue() for _ in range(processes)]
+    # Goal reports and parent replies come from different workers, and a Queue only keeps the order of messages from
+    # one process, so they get a queue each
+    results = Queue()
+    replies = Queue()
+    incumbent = Value('d', inf)
+    # Goal reports put on results, counted under the incumbent's lock
+    goal_reports = Value('q', 0, lock=False)
+    # The last sent counter belongs to this process, which seeds the search
+    sent = Array('q', processes+1, lock=False)
+    received = Array('q', processes, lock=False)
+    idle = Array('b', processes, lock=False)
+
+    workers = [Process(target=hda_worker, args=(index, problem, inboxes, results, replies, incumbent, goal_reports,
+                                                sent, received, idle, batch_size, expansions_per_poll), daemon=True)
+               for index in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    start = problem.start_state
+    start_packed = start.pack()
+    sent[processes] = 1
+    inboxes[owner(start_packed, processes)].put([(start_packed, 0, problem.cost_function(start), None)])
+
+    # Quiescence: every worker idle and all batches received, seen twice in a row with no traffic in between
+    previous = None
+    while True:
+        sleep(poll_interval)
+        snapshot = (sum(sent), sum(received))
+        if all(idle) and snapshot[0] == snapshot[1] and snapshot == previous:
+            break
+        previous = snapshot if all(idle) else None
+
+    for inbox in inboxes:
+        inbox.put('stop')
+
+    # Every improvement of the incumbent was reported, in no particular order, so all reports are read and the
+    # cheapest kept
+    goal = None
+    for _ in range(goal_reports.value):
+        message = results.get()
+        if goal is None or message[1] < goal[1]:
+            goal = message
+
+    path = []
+    if goal is not None:
+        packed = goal[2]
+        while packed is not None:
+            path.append(packed)
+            inboxes[owner(packed, processes)].put(('parent', packed))
+            packed = replies.get()[1]
+        path.reverse()
+
+    for inbox in inboxes:
+        inbox.put('exit')
+    worker_expansions = [0]*processes
+    total_nodes = 1
+    for _ in range(processes):
+        _, index, expansions, generated = results.get()
+        worker_expansions[index] = expansions
+        total_nodes += generated
+    for worker in workers:
+        worker.join()
+
+    mean_expansions = sum(worker_expansions) / processes
+    result = {'outcome': 'success' if goal is not None else 'failed',
+              'solution': [start] + [start.unpack(packed) for packed in path[1:]] if path else [start],
+              'total_nodes': total_nodes,
+              'worker_expansions': worker_expansions,
+              'load_balance': max(worker_expansions) / mean_expansions if mean_expansions else 1,
+              'problem': problem}
+    return result
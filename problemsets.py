@@ -0,0 +1,220 @@
+''' Columnar problem sets. A QueensSet holds K boards as a K x n array of queen rows (one queen per column); a
+PuzzleSet holds K start boards and K goal boards as K x cells arrays plus a depth column (-1 where the optimal solution
+length is unknown). Sets are generated with vectorized random numbers, saved as one .npy file per column (which can
+be memory-mapped back), and shared with worker processes through multiprocessing.shared_memory without copying.
+Indexing a set builds the QueensProblem or PuzzleProblem for one row on demand:
+
+    boards = QueensSet.random(1000, seed=1)
+    with boards.shared() as handle:         # workers receive handle (a few names) instead of pickled problems
+        pool.map(solve_row, [(handle, index) for index in range(len(boards))])
+
+    def solve_row(task):
+        handle, index = task
+        return astar(handle.attach()[index]) '''
+
+import os
+from multiprocessing import shared_memory
+import numpy
+from puzzle import neighbour_table
+
+
+class ColumnarSet:
+    ''' Common storage of QueensSet and PuzzleSet: named numpy columns with one row per problem, plus the scalar
+    attributes needed to turn a row into a problem '''
+
+    column_names = ()
+
+    def __init__(self, columns, **attributes):
+        self.columns = columns
+        self.attributes = attributes
+        for name, column in columns.items():
+            setattr(self, name, column)
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.columns[self.column_names[0]])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # Slices of numpy arrays are views, so a sub-set shares its rows with this set
+            return type(self)({name: column[index] for name, column in self.columns.items()}, **self.attributes)
+        return self.problem(index)
+
+    def take(self, indices):
+        ''' Returns a set of the rows at indices, copied '''
+        return type(self)({name: column[indices] for name, column in self.columns.items()}, **self.attributes)
+
+    def __iter__(self):
+        return (self.problem(index) for index in range(len(self)))
+
+    def problem(self, index):
+        raise NotImplementedError
+
+    def save(self, directory):
+        ''' Writes every column to directory/<column>.npy and the attributes to directory/attributes.npy '''
+        os.makedirs(directory, exist_ok=True)
+        for name, column in self.columns.items():
+            numpy.save(os.path.join(directory, name + '.npy'), column)
+        numpy.save(os.path.join(directory, 'attributes.npy'), numpy.array([self.attributes]), allow_pickle=True)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        ''' Reads a set written by save. With the default mmap_mode the columns are memory-mapped read-only, so rows
+        are read from disk as they are used and processes loading the same files share the page cache. '''
+        attributes = numpy.load(os.path.join(directory, 'attributes.npy'), allow_pickle=True)[0]
+        return cls({name: numpy.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                    for name in cls.column_names}, **attributes)
+
+    def shared(self):
+        ''' Copies the columns into shared memory and returns a SharedSet, a context manager whose handle attaches to
+        them from worker processes. The shared memory is released when the context exits. '''
+        return SharedSet(self)
+
+
+class SharedSet:
+
+    def __init__(self, problem_set):
+        self.blocks = []
+        columns = {}
+        for name, column in problem_set.columns.items():
+            block = shared_memory.SharedMemory(create=True, size=max(column.nbytes, 1))
+            numpy.ndarray(column.shape, column.dtype, buffer=block.buf)[...] = column
+            self.blocks.append(block)
+            columns[name] = (block.name, column.shape, column.dtype.str)
+        self.handle = SharedSetHandle(type(problem_set), columns, problem_set.attributes)
+
+    def __enter__(self):
+        return self.handle
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+# Sets attached in this process, by the names of their shared memory blocks, so each worker attaches once
+attached_sets = {}
+
+
+class SharedSetHandle:
+    ''' Picklable reference to a set in shared memory. attach() returns the set with its columns backed by the shared
+    memory itself, read-only. Meant for the worker processes of the process that shared the set. '''
+
+    def __init__(self, set_class, columns, attributes):
+        self.set_class = set_class
+        self.columns = columns
+        self.attributes = attributes
+
+    def attach(self):
+        key = tuple(block_name for block_name, _, _ in self.columns.values())
+        if key not in attached_sets:
+            blocks = []
+            columns = {}
+            for name, (block_name, shape, dtype) in self.columns.items():
+                # Processes started by the creator share its resource tracker, so attaching does not make the block
+                # outlive or die with this process
+                block = shared_memory.SharedMemory(block_name)
+                blocks.append(block)
+                column = numpy.ndarray(shape, numpy.dtype(dtype), buffer=block.buf)
+                column.flags.writeable = False
+                columns[name] = column
+            problem_set = self.set_class(columns, **self.attributes)
+            # The blocks must stay open for as long as the arrays use their buffers
+            problem_set.blocks = blocks
+            attached_sets[key] = problem_set
+        return attached_sets[key]
+
+
+class QueensSet(ColumnarSet):
+
+    column_names = ('rows',)
+
+    def __init__(self, columns, side_length=8):
+        super().__init__(columns, side_length=side_length)
+
+    @classmethod
+    def random(cls, count, side_length=8, seed=None):
+        ''' count boards with one queen in a uniformly random row of every column, like QueensState() '''
+        rng = numpy.random.default_rng(seed)
+        return cls({'rows': rng.integers(0, side_length, size=(count, side_length), dtype=numpy.int8)},
+                   side_length=side_length)
+
+    def problem(self, index):
+        from queens import QueensProblem, QueensState
+        return QueensProblem(QueensState(list(enumerate(self.rows[index].tolist())), side_length=self.side_length))
+
+
+class PuzzleSet(ColumnarSet):
+
+    column_names = ('starts', 'goals', 'depths')
+
+    def __init__(self, columns, shape=(3, 3)):
+        super().__init__(columns, shape=tuple(shape))
+
+    @staticmethod
+    def goal_boards(count, shape):
+        return numpy.tile(numpy.arange(1, shape[0]*shape[1]+1, dtype=numpy.int8), (count, 1))
+
+    @classmethod
+    def random(cls, count, shape=(3, 3), seed=None):
+        ''' count uniformly random solvable starts for the standard goal (tiles in order, blank last), depth unknown '''
+        rng = numpy.random.default_rng(seed)
+        goals = cls.goal_boards(count, shape)
+        starts = rng.permuted(goals, axis=1)
+        cells = shape[0]*shape[1]
+        rows = numpy.arange(count)
+
+        # Solvable when the permutation parity equals the parity of the blank's distance from its goal cell (see
+        # puzzle.is_solvable); the goal is the identity, so the permutation parity is the parity of the inversions
+        earlier, later = numpy.triu_indices(cells, 1)
+        inversions = (starts[:, earlier] > starts[:, later]).sum(axis=1)
+        blank = numpy.argmax(starts == cells, axis=1)
+        distance = abs(blank // shape[1] - (shape[0]-1)) + abs(blank % shape[1] - (shape[1]-1))
+        unsolvable = rows[inversions % 2 != distance % 2]
+
+        # Swapping the first two tiles that are not the blank flips the parity without moving the blank
+        first = (blank[unsolvable] == 0).astype(numpy.intp)
+        second = first + 1 + (blank[unsolvable] == first + 1)
+        starts[unsolvable, first], starts[unsolvable, second] = starts[unsolvable, second], starts[unsolvable, first]
+        return cls({'starts': starts, 'goals': goals, 'depths': numpy.full(count, -1, dtype=numpy.int16)}, shape=shape)
+
+    @classmethod
+    def random_walks(cls, count, shape=(3, 3), walk_length=40, seed=None):
+        ''' count starts made by walking the blank walk_length random moves away from the standard goal, all boards
+        moving together. The depth is unknown (at most walk_length). '''
+        rng = numpy.random.default_rng(seed)
+        goals = cls.goal_boards(count, shape)
+        starts = goals.copy()
+        cells = shape[0]*shape[1]
+        rows = numpy.arange(count)
+
+        table = neighbour_table(*shape)
+        moves = numpy.array([list(neighbours) + [-1]*(4-len(neighbours)) for neighbours in table])
+        move_counts = numpy.array([len(neighbours) for neighbours in table])
+        blank = numpy.full(count, cells-1)
+        for _ in range(walk_length):
+            choice = (rng.random(count) * move_counts[blank]).astype(numpy.intp)
+            destination = moves[blank, choice]
+            starts[rows, blank] = starts[rows, destination]
+            starts[rows, destination] = cells
+            blank = destination
+        return cls({'starts': starts, 'goals': goals, 'depths': numpy.full(count, -1, dtype=numpy.int16)}, shape=shape)
+
+    @classmethod
+    def from_samples(cls, samples, shape=(3, 3)):
+        ''' Builds a set from {'start', 'end', 'depth'} dicts, such as the depth samples in puzzle.py '''
+        return cls({'starts': numpy.array([sample['start'] for sample in samples], dtype=numpy.int8),
+                    'goals': numpy.array([sample['end'] for sample in samples], dtype=numpy.int8),
+                    'depths': numpy.array([sample.get('depth', -1) for sample in samples], dtype=numpy.int16)},
+                   shape=shape)
+
+    def problem(self, index, cost_function=None):
+        from puzzle import PuzzleProblem, h_manhattan
+        depth = int(self.depths[index])
+        return PuzzleProblem(cost_function or h_manhattan, self.starts[index].tolist(), self.goals[index].tolist(),
+                             depth if depth >= 0 else None, shape=self.shape)
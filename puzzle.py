@@ -1,8 +1,16 @@
 from copy import copy
-from random import choice, shuffle
+from random import randrange, shuffle
 from itertools import permutations, chain
 import pickle
 from math import floor
+from bisect import bisect_left
+from functools import lru_cache
+from threading import Lock
+from search import zobrist_keys
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def swap(seq, index1, index2):
@@ -26,41 +34,133 @@ def num_list_to_int(num_list):
     return int(''.join([str(num) for num in num_list]))
 
 
-class PuzzleState:
+@lru_cache(maxsize=None)
+def neighbour_table(height, width):
+    ''' Returns, for every cell of a height x width board, the cells the blank can move to from it (up, down, left,
+    right) '''
+    table = []
+    for cell in range(height*width):
+        row, col = divmod(cell, width)
+        neighbours = []
+        if row > 0:                # Move up
+            neighbours.append(cell - width)
+        if row < height - 1:       # Move down
+            neighbours.append(cell + width)
+        if col > 0:                # Move left
+            neighbours.append(cell - 1)
+        if col < width - 1:        # Move right
+            neighbours.append(cell + 1)
+        table.append(tuple(neighbours))
+    return tuple(table)
+
+
+def is_solvable(start, goal, width):
+    ''' Returns whether goal can be reached from start on a board width cells wide. Every move swaps the blank with
+    a tile, flipping both the parity of the permutation from start to goal and the parity of the blank's distance
+    from its goal cell, so the two parities must agree (which also suffices on boards at least 2 x 2). O(n). '''
+    goal_cells = [0]*(len(goal)+1)
+    for cell, tile in enumerate(goal):
+        goal_cells[tile] = cell
+    permutation = [goal_cells[tile] for tile in start]
+
+    visited = [False]*len(permutation)
+    cycles = 0
+    for cell in range(len(permutation)):
+        if not visited[cell]:
+            cycles += 1
+            while not visited[cell]:
+                visited[cell] = True
+                cell = permutation[cell]
+
+    blank_row, blank_col = divmod(start.index(len(start)), width)
+    goal_row, goal_col = divmod(goal.index(len(goal)), width)
+    return (len(permutation) - cycles) % 2 == (abs(blank_row - goal_row) + abs(blank_col - goal_col)) % 2
+
+
+def random_solvable_sequence(goal, width):
+    ''' Returns a uniformly random start from which goal can be reached '''
+    start = list(goal)
+    shuffle(start)
+    if not is_solvable(start, goal, width):
+        # Swapping two tiles flips the permutation parity without moving the blank
+        first, second = [cell for cell, tile in enumerate(start) if tile != len(start)][:2]
+        start[first], start[second] = start[second], start[first]
+    return start
+
 
-    instance_counter = 0
+class PuzzleState:
 
-    def __init__(self, sequence, parent=None, path_cost=0, f_cost=0):
+    def __init__(self, sequence, parent=None, path_cost=0, f_cost=0, shape=None, zobrist=None):
         self.sequence = sequence
-        self.hash = hash(int('0'.join([str(n) for n in self.sequence])))
         self.empty = len(sequence)
-        self.side_length = int(self.empty**0.5)
+        # Zobrist hash of the tiles' cells (the blank's cell follows from them), given by the parent for a child one
+        # move away
+        if zobrist is None:
+            keys = zobrist_keys(self.empty**2)
+            zobrist = 0
+            for cell, tile in enumerate(sequence):
+                if tile != self.empty:
+                    zobrist ^= keys[(tile-1)*self.empty + cell]
+        self.hash = zobrist
+        if shape is None:
+            side_length = int(round(self.empty**0.5))
+            if side_length**2 != self.empty:
+                raise ValueError('A shape (rows, cols) is required for a non-square puzzle of ' + str(self.empty) +
+                                 ' cells')
+            shape = (side_length, side_length)
+        self.shape = shape
+        self.height, self.width = shape
+        # side_length is the row width; it predates rectangular boards
+        self.side_length = self.width
         self.path_cost = path_cost
         self.f_cost = f_cost
         self.parent = parent
-        PuzzleState.instance_counter += 1
-        self.id = PuzzleState.instance_counter
+        # Children remember the state they were generated from so heuristics can be updated incrementally from the
+        # values cached on it
+        self.origin = None
+        self.heuristic_cache = None
 
     def get_children(self):
-
         empty = self.sequence.index(self.empty)
-        children = []
+        return [self.moved_child(empty, neighbour) for neighbour in neighbour_table(self.height, self.width)[empty]]
 
-        if (empty-self.side_length) >= 0:              # Move up
-            children.append(swap(self.sequence, empty, empty - self.side_length))
-        if (empty+self.side_length) < self.empty:      # Move down
-            children.append(swap(self.sequence, empty, empty + self.side_length))
-        if empty % self.side_length != 0:              # Move left
-            children.append(swap(self.sequence, empty, empty - 1))
-        if (empty + 1) % self.side_length != 0:        # Move right
-            children.append(swap(self.sequence, empty, empty + 1))
+    def num_moves(self):
+        return len(neighbour_table(self.height, self.width)[self.sequence.index(self.empty)])
 
-        children = [PuzzleState(child) for child in children]
+    def child_for_move(self, move):
+        ''' Returns the child made by move, an index below num_moves(), in the order of get_children() '''
+        empty = self.sequence.index(self.empty)
+        return self.moved_child(empty, neighbour_table(self.height, self.width)[empty][move])
 
-        return children
+    def moved_child(self, empty, neighbour):
+        ''' Returns the child in which the tile at cell neighbour slid into the empty cell '''
+        tile = self.sequence[neighbour]
+        keys = zobrist_keys(self.empty**2)
+        zobrist = self.hash ^ keys[(tile-1)*self.empty + neighbour] ^ keys[(tile-1)*self.empty + empty]
+        child = PuzzleState(swap(self.sequence, empty, neighbour), shape=self.shape, zobrist=zobrist)
+        child.origin = self
+        return child
 
     def random_child(self):
-        return choice(self.get_children())
+        return self.child_for_move(randrange(self.num_moves()))
+
+    def packed_bits(self):
+        return len(self.sequence) * (len(self.sequence)-1).bit_length()
+
+    def pack(self):
+        ''' Packs the sequence into an int holding tile-1 for every cell in a fixed-width bit field '''
+        bits = (len(self.sequence)-1).bit_length()
+        packed = 0
+        for tile in reversed(self.sequence):
+            packed = (packed << bits) | (tile-1)
+        return packed
+
+    def unpack(self, packed):
+        ''' Returns the state of the same size as self that pack() turned into packed '''
+        bits = (len(self.sequence)-1).bit_length()
+        mask = (1 << bits) - 1
+        return PuzzleState([((packed >> (bits*cell)) & mask) + 1 for cell in range(len(self.sequence))],
+                           shape=self.shape)
 
     def get_non_empty_tiles(self):
         tiles = copy(self.sequence)
@@ -68,10 +168,10 @@ class PuzzleState:
         return tiles
 
     def get_rows(self):
-        return [self.sequence[(n * self.side_length):((n + 1) * self.side_length)] for n in range(0, self.side_length)]
+        return [self.sequence[(n * self.width):((n + 1) * self.width)] for n in range(0, self.height)]
 
     def get_cols(self):
-        return [self.sequence[col_start::self.side_length] for col_start in range(0, self.side_length)]
+        return [self.sequence[col_start::self.width] for col_start in range(0, self.width)]
 
     def __str__(self):
         max_tile_width = len(str(self.empty))
@@ -84,17 +184,21 @@ class PuzzleState:
         return '\n'.join(seqstr)
 
     def __lt__(self, other):
-        return (self.f_cost < other.f_cost) or (self.f_cost == other.f_cost and self.id > other.id)
+        # Searches that need a tie-break keep their own counter (see astar's node ids), so states share no counter
+        return self.f_cost < other.f_cost
 
     def __eq__(self, other):
-        return self.sequence == other.sequence
+        # The sequences are only compared when the hashes collide
+        return self.hash == other.hash and self.sequence == other.sequence
 
     def __hash__(self):
         return self.hash
 
 
-def get_random_depth_sample(n=8, depths=list(range(2, 26, 2)), num_samples=100):
-    """ Returns num_samples random n-puzzle start and end states per solution depth in list depths"""
+def get_random_depth_sample(n=8, depths=list(range(2, 26, 2)), num_samples=100, shape=None):
+    """ Returns num_samples random n-puzzle start and end states per solution depth in list depths. Every end state
+    is found by breadth-first search from its start state, so all samples are solvable. shape is (rows, cols) for
+    non-square boards."""
 
     def get_states(start):
         frontier = [start]
@@ -130,7 +234,7 @@ def get_random_depth_sample(n=8, depths=list(range(2, 26, 2)), num_samples=100):
     for _ in range(num_samples):
         start = list(range(1, n+2))
         shuffle(start)
-        start = PuzzleState(start, path_cost=0)
+        start = PuzzleState(start, path_cost=0, shape=shape)
 
         states = get_states(start)
         print('\rSet ' + str(_+1) + ' of ' + str(num_samples) + ' complete', end='', flush=True)
@@ -180,7 +284,7 @@ def h_manhattan(node, goal):
 
     def get_index(node, val):
         linear_index = node.sequence.index(val)
-        return (linear_index % node.side_length, floor(linear_index/node.side_length))
+        return (linear_index % node.width, floor(linear_index/node.width))
 
     distance = 0
     for i in node.get_non_empty_tiles():
@@ -191,12 +295,234 @@ def h_manhattan(node, goal):
     return distance
 
 
+def cached_components(node, goal, name, compute, update):
+    ''' Returns the components a heuristic derives its value from, cached on node. When node was generated from a
+    state that already has them, they are updated for the single tile that moved rather than recomputed. '''
+    key = (name, goal.hash)
+    if node.heuristic_cache is None:
+        node.heuristic_cache = {}
+    elif key in node.heuristic_cache:
+        return node.heuristic_cache[key]
+
+    origin = node.origin
+    if origin is None:
+        components = compute(node, goal)
+    else:
+        if origin.heuristic_cache is None:
+            origin.heuristic_cache = {}
+        if key not in origin.heuristic_cache:
+            origin.heuristic_cache[key] = compute(origin, goal)
+        # The tile that moved now sits where the blank was in origin
+        old_cell = node.sequence.index(node.empty)
+        new_cell = origin.sequence.index(origin.empty)
+        components = update(origin.heuristic_cache[key], node.sequence[new_cell], old_cell, new_cell, node, goal)
+
+    node.heuristic_cache[key] = components
+    return components
+
+
+def goal_coordinates(goal):
+    ''' Returns a list mapping every tile to its (row, col) in goal '''
+    if goal.heuristic_cache is None:
+        goal.heuristic_cache = {}
+    if 'coordinates' not in goal.heuristic_cache:
+        coordinates = [None]*(len(goal.sequence)+1)
+        for cell, tile in enumerate(goal.sequence):
+            coordinates[tile] = divmod(cell, goal.width)
+        goal.heuristic_cache['coordinates'] = coordinates
+    return goal.heuristic_cache['coordinates']
+
+
+def line_conflicts(goal_offsets):
+    ''' Returns the fewest tiles that must leave a line so that the rest, whose goal offsets along the line are given
+    in their current order, can reach their goal cells without passing each other '''
+    # len(goal_offsets) minus the length of the longest increasing subsequence
+    tails = []
+    for offset in goal_offsets:
+        index = bisect_left(tails, offset)
+        if index == len(tails):
+            tails.append(offset)
+        else:
+            tails[index] = offset
+    return len(goal_offsets) - len(tails)
+
+
+def row_conflicts(sequence, row, width, coordinates, empty):
+    tiles = sequence[row*width:(row+1)*width]
+    return line_conflicts([coordinates[tile][1] for tile in tiles if tile != empty and coordinates[tile][0] == row])
+
+
+def col_conflicts(sequence, col, width, coordinates, empty):
+    tiles = sequence[col::width]
+    return line_conflicts([coordinates[tile][0] for tile in tiles if tile != empty and coordinates[tile][1] == col])
+
+
+def linear_conflict_components(node, goal):
+    coordinates = goal_coordinates(goal)
+    width = node.width
+    manhattan = 0
+    for cell, tile in enumerate(node.sequence):
+        if tile != node.empty:
+            row, col = divmod(cell, width)
+            manhattan += abs(row - coordinates[tile][0]) + abs(col - coordinates[tile][1])
+    return (manhattan,
+            [row_conflicts(node.sequence, row, width, coordinates, node.empty) for row in range(node.height)],
+            [col_conflicts(node.sequence, col, width, coordinates, node.empty) for col in range(width)])
+
+
+def update_linear_conflict_components(components, tile, old_cell, new_cell, node, goal):
+    manhattan, rows, cols = components
+    coordinates = goal_coordinates(goal)
+    width = node.width
+    old_row, old_col = divmod(old_cell, width)
+    new_row, new_col = divmod(new_cell, width)
+    goal_row, goal_col = coordinates[tile]
+    manhattan += abs(new_row - goal_row) + abs(new_col - goal_col) - abs(old_row - goal_row) - abs(old_col - goal_col)
+
+    # Moving a tile along a line never changes the order of the tiles in that line, so only the lines the tile left
+    # and entered have to be recounted
+    if old_row != new_row:
+        rows = list(rows)
+        rows[old_row] = row_conflicts(node.sequence, old_row, width, coordinates, node.empty)
+        rows[new_row] = row_conflicts(node.sequence, new_row, width, coordinates, node.empty)
+    else:
+        cols = list(cols)
+        cols[old_col] = col_conflicts(node.sequence, old_col, width, coordinates, node.empty)
+        cols[new_col] = col_conflicts(node.sequence, new_col, width, coordinates, node.empty)
+    return manhattan, rows, cols
+
+
+def h_linear_conflict(node, goal):
+    ''' Manhattan distance plus 2 for every tile that has to step out of its goal row or column to let other tiles in
+    that line pass. Admissible. '''
+    manhattan, rows, cols = cached_components(node, goal, 'linear_conflict', linear_conflict_components,
+                                              update_linear_conflict_components)
+    return manhattan + 2*(sum(rows) + sum(cols))
+
+
+@lru_cache(maxsize=None)
+def walking_distance_table(lines, line_length, goal_blank_line):
+    ''' Breadth-first search over Takahashi's walking distance configurations for moves across lines (rows for
+    vertical moves, or columns for horizontal moves). A configuration is (counts, blank_line), where counts[i][j] is
+    the number of tiles in line i whose goal is line j. Returns a dict mapping each configuration to the fewest moves
+    that bring every tile into its goal line. '''
+    goal_counts = tuple(tuple((line_length - (line == goal_blank_line)) if goal_line == line else 0
+                              for goal_line in range(lines)) for line in range(lines))
+    goal_config = (goal_counts, goal_blank_line)
+    distances = {goal_config: 0}
+    frontier = [goal_config]
+    while frontier:
+        next_frontier = []
+        for counts, blank_line in frontier:
+            for source in (blank_line-1, blank_line+1):
+                if not 0 <= source < lines:
+                    continue
+                for goal_line in range(lines):
+                    if counts[source][goal_line]:
+                        config = (move_tile_between_lines(counts, goal_line, source, blank_line), source)
+                        if config not in distances:
+                            distances[config] = distances[(counts, blank_line)] + 1
+                            next_frontier.append(config)
+        frontier = next_frontier
+    return distances
+
+
+def move_tile_between_lines(counts, goal_line, source, destination):
+    counts = list(counts)
+    source_counts = list(counts[source])
+    source_counts[goal_line] -= 1
+    counts[source] = tuple(source_counts)
+    destination_counts = list(counts[destination])
+    destination_counts[goal_line] += 1
+    counts[destination] = tuple(destination_counts)
+    return tuple(counts)
+
+
+def walking_distance_components(node, goal):
+    coordinates = goal_coordinates(goal)
+    width = node.width
+    height = node.height
+    row_counts = [[0]*height for _ in range(height)]
+    col_counts = [[0]*width for _ in range(width)]
+    for cell, tile in enumerate(node.sequence):
+        row, col = divmod(cell, width)
+        if tile == node.empty:
+            blank_row, blank_col = row, col
+        else:
+            row_counts[row][coordinates[tile][0]] += 1
+            col_counts[col][coordinates[tile][1]] += 1
+    return (tuple(tuple(counts) for counts in row_counts), blank_row,
+            tuple(tuple(counts) for counts in col_counts), blank_col)
+
+
+def update_walking_distance_components(components, tile, old_cell, new_cell, node, goal):
+    row_counts, blank_row, col_counts, blank_col = components
+    goal_row, goal_col = goal_coordinates(goal)[tile]
+    old_row, old_col = divmod(old_cell, node.width)
+    new_row, new_col = divmod(new_cell, node.width)
+    # The blank takes the cell the tile left
+    if old_row != new_row:
+        return move_tile_between_lines(row_counts, goal_row, old_row, new_row), old_row, col_counts, blank_col
+    return row_counts, blank_row, move_tile_between_lines(col_counts, goal_col, old_col, new_col), old_col
+
+
+def h_walking_distance(node, goal):
+    ''' Takahashi's walking distance: the fewest vertical moves that bring every tile into its goal row, ignoring
+    columns, plus the same for horizontal moves and goal columns, looked up in precomputed tables. Admissible. '''
+    row_counts, blank_row, col_counts, blank_col = cached_components(
+        node, goal, 'walking_distance', walking_distance_components, update_walking_distance_components)
+    goal_row, goal_col = goal_coordinates(goal)[goal.empty]
+    return walking_distance_table(node.height, node.width, goal_row)[(row_counts, blank_row)] + \
+        walking_distance_table(node.width, node.height, goal_col)[(col_counts, blank_col)]
+
+
+def manhattan_table(goal):
+    ''' Returns a table indexed by [cell][tile] holding the Manhattan distance of tile at cell from its cell in goal, with
+    0 for the blank, cached on goal '''
+    coordinates = goal_coordinates(goal)
+    if 'manhattan_table' not in goal.heuristic_cache:
+        goal.heuristic_cache['manhattan_table'] = [
+            [0 if tile == goal.empty or coordinates[tile] is None else
+             abs(coordinates[tile][0] - cell // goal.width) + abs(coordinates[tile][1] - cell % goal.width)
+             for tile in range(len(coordinates))] for cell in range(len(goal.sequence))]
+        if numpy is not None:
+            goal.heuristic_cache['manhattan_array'] = numpy.array(goal.heuristic_cache['manhattan_table'])
+    return goal.heuristic_cache['manhattan_table']
+
+
+def h_manhattan_batch(nodes, goal, min_array_batch=32):
+    ''' Returns h_manhattan for every node. Batches of at least min_array_batch nodes are scored with a single
+    NumPy gather from the distance table when NumPy is available; smaller ones are cheaper as plain table lookups. '''
+    table = manhattan_table(goal)
+    if numpy is not None and len(nodes) >= min_array_batch:
+        sequences = numpy.array([node.sequence for node in nodes])
+        return goal.heuristic_cache['manhattan_array'][numpy.arange(sequences.shape[1]), sequences].sum(axis=1).tolist()
+    return [sum([row[tile] for row, tile in zip(table, node.sequence)]) for node in nodes]
+
+
+# Heuristics with a batched form that scores many states in one call
+batch_heuristics = {h_manhattan: h_manhattan_batch}
+
+
+def check_admissible(cost_function, depth_samples=None):
+    ''' Returns the samples (by default all loaded depth samples) for which cost_function overestimates the optimal
+    solution depth '''
+    if depth_samples is None:
+        depth_samples = load_shuffled_depth_samples()
+    return [sample for sample in depth_samples
+            if cost_function(PuzzleState(sample['start']), PuzzleState(sample['end'])) > sample['depth']]
+
+
 class PuzzleProblem:
 
-    depth_samples = load_shuffled_depth_samples()
+    # Samples are loaded on first use so that importing this module (e.g. in solver worker processes) does not read
+    # or generate the sample file
+    depth_samples = None
     current_sample = 0
+    # Problems made without a start state take the next sample, so threads take turns moving the cursor
+    sample_lock = Lock()
 
-    def __init__(self, cost_function=h_manhattan, start_state=None, goal_state=None, solution_cost=None):
+    def __init__(self, cost_function=h_manhattan, start_state=None, goal_state=None, solution_cost=None, shape=None):
 
         if not start_state and not goal_state and not solution_cost:
             problem = self.next_problem()
@@ -204,28 +530,72 @@ class PuzzleProblem:
             goal_state = problem['end']
             solution_cost = problem['depth']
 
-        self.start_state = PuzzleState(start_state)
-        self.goal_state = PuzzleState(goal_state)
+        self.start_state = PuzzleState(start_state, shape=shape)
+        self.goal_state = PuzzleState(goal_state, shape=shape)
         self.solution_cost = solution_cost
         self.heuristic_function = cost_function
 
     def next_problem(self):
 
-        if PuzzleProblem.current_sample == len(PuzzleProblem.depth_samples):
-            print('\nExhausted puzzle samples. Restarting with sample 0.')
-            PuzzleProblem.current_sample = 0
+        with PuzzleProblem.sample_lock:
+            if PuzzleProblem.depth_samples is None:
+                PuzzleProblem.depth_samples = load_shuffled_depth_samples()
+
+            if PuzzleProblem.current_sample == len(PuzzleProblem.depth_samples):
+                print('\nExhausted puzzle samples. Restarting with sample 0.')
+                PuzzleProblem.current_sample = 0
 
-        problem = PuzzleProblem.depth_samples[PuzzleProblem.current_sample]
-        PuzzleProblem.current_sample += 1
+            problem = PuzzleProblem.depth_samples[PuzzleProblem.current_sample]
+            PuzzleProblem.current_sample += 1
 
         return problem
 
     def goal_test(self, state):
         return state == self.goal_state
 
+    def is_solvable(self):
+        return is_solvable(self.start_state.sequence, self.goal_state.sequence, self.goal_state.width)
+
     def cost_function(self, state):
         return self.heuristic_function(state, self.goal_state)
 
+    def cost_function_batch(self, states):
+        batch = batch_heuristics.get(self.heuristic_function)
+        if batch is None:
+            return [self.heuristic_function(state, self.goal_state) for state in states]
+        return batch(states, self.goal_state)
+
+    def reverse_cost_function(self, state):
+        # Estimated distance from state back to the start, for searches that also run backwards from the goal
+        return self.heuristic_function(state, self.start_state)
+
+    def reverse_cost_function_batch(self, states):
+        batch = batch_heuristics.get(self.heuristic_function)
+        if batch is None:
+            return [self.heuristic_function(state, self.start_state) for state in states]
+        return batch(states, self.start_state)
+
+    def canonical_key(self):
+        # Relabeling every tile by its position in the goal turns the goal into the identity, so all instances that
+        # differ only in tile labels share a key. The goal's blank position fixes which canonical label is the blank.
+        # The heuristic is part of the key too: different heuristics lead a search to different paths and node counts.
+        goal = self.goal_state.sequence
+        relabel = {tile: index+1 for index, tile in enumerate(goal)}
+        return 'puzzle:' + self.heuristic_function.__name__ + ':' + str(self.goal_state.height) + 'x' + \
+            str(self.goal_state.width) + ':' + str(goal.index(self.goal_state.empty)) + ':' + \
+            ','.join(str(relabel[tile]) for tile in self.start_state.sequence)
+
+    def encode_path(self, path):
+        # A path is stored as the sequence of blank positions, which does not depend on the tile labels
+        return [state.sequence.index(state.empty) for state in path]
+
+    def decode_path(self, blank_positions):
+        path = [self.start_state]
+        for position in blank_positions[1:]:
+            blank = path[-1].sequence.index(path[-1].empty)
+            path.append(PuzzleState(swap(path[-1].sequence, blank, position), shape=self.start_state.shape))
+        return path
+
     def optimal_solution_cost(self):
         ''' Returns smallest number of queens that need to be moved to get to an optimal solution from queens_state'''
         return self.solution_cost
\ No newline at end of file
@@ -2,18 +2,40 @@ from random import randrange
 from copy import deepcopy
 from heapq import heappop, heappush
 from timeit import default_timer as timer
-from random import choice, shuffle, random
+from random import shuffle, random
 from math import exp
-from search import steepest_ascent_hill_climb
+from functools import lru_cache
+from bisect import bisect_left
+from threading import Lock
+from search import steepest_ascent_hill_climb, zobrist_keys
 
 
-class QueensState:
+@lru_cache(maxsize=None)
+def symmetry_tables(side_length):
+    ''' Returns the 8 symmetries of the board as tables that map each square (col, row), indexed by
+    col*side_length + row, to its image. The first 4 keep columns as columns, so they also map the
+    one-queen-per-column move model onto itself, and each of them is its own inverse. '''
+    n = side_length - 1
+    transforms = [lambda c, r: (c, r), lambda c, r: (c, n-r), lambda c, r: (n-c, r), lambda c, r: (n-c, n-r),
+                  lambda c, r: (r, c), lambda c, r: (n-r, c), lambda c, r: (r, n-c), lambda c, r: (n-r, n-c)]
+    return [tuple(transform(c, r) for c in range(side_length) for r in range(side_length)) for transform in transforms]
+
+
+@lru_cache(maxsize=None)
+def symmetry_bit_tables(side_length):
+    ''' Returns symmetry_tables(side_length) with every image square (col, row) replaced by the bit it sets in pack() '''
+    return [tuple(1 << (col*side_length + row) for col, row in table) for table in symmetry_tables(side_length)]
+
 
-    instance_counter = 0
+class QueensState:
 
-    def __init__(self, queen_positions=None, queen_num=8, parent=None, path_cost=0, f_cost=0, side_length=8):
+    def __init__(self, queen_positions=None, queen_num=8, parent=None, path_cost=0, f_cost=0, side_length=8,
+                 reduce_symmetry=False, zobrist=None):
 
         self.side_length = side_length
+        # With reduce_symmetry, boards that are rotations or reflections of each other hash and compare as equal
+        self.reduce_symmetry = reduce_symmetry
+        self.canonical = None
 
         if queen_positions is None:
             self.queen_num = queen_num
@@ -22,11 +44,22 @@ class QueensState:
             self.queen_positions = frozenset(queen_positions)
             self.queen_num = len(self.queen_positions)
 
+        # Zobrist hash of the squares, given by the parent for a child one move away
+        if zobrist is None:
+            keys = zobrist_keys(side_length**2)
+            zobrist = 0
+            for col, row in self.queen_positions:
+                zobrist ^= keys[col*side_length + row]
+        self.zobrist = zobrist
+
         self.path_cost = 0
         self.f_cost = f_cost
         self.parent = parent
-        self.id = QueensState.instance_counter
-        QueensState.instance_counter += 1
+        # Children remember the state and move they were made from, so attack_lines can be updated from the lines
+        # cached on it
+        self.origin = None
+        self.move = None
+        self.line_cache = None
 
     def random_queen_position(self):
         # Each queen is placed in a random row in a separate column
@@ -36,22 +69,74 @@ class QueensState:
         return queen_positions
 
     def get_children(self):
-        children = []
-        parent_queen_positions = list(self.queen_positions)
-        for queen_index, queen in enumerate(parent_queen_positions):
-            new_positions = [(queen[0], row) for row in range(self.side_length) if row != queen[1]]
-            for new_position in new_positions:
-                queen_positions = deepcopy(parent_queen_positions)
-                queen_positions[queen_index] = new_position
-                children.append(QueensState(queen_positions))
-        return children
+        return [self.child_for_move(move) for move in range(self.num_moves())]
 
-    def random_child(self):
+    def num_moves(self):
+        # A move puts one queen in another row of its column
+        return self.queen_num * (self.side_length - 1)
+
+    def child_for_move(self, move):
+        ''' Returns the child made by move, an index below num_moves(). The moves of a state are numbered in the
+        iteration order of its queen_positions, which is fixed for a given state. '''
         queen_positions = list(self.queen_positions)
-        random_queen_index = randrange(len(self.queen_positions))
-        queen_positions[random_queen_index] = (queen_positions[random_queen_index][0],
-            choice([row for row in range(self.side_length) if row != queen_positions[random_queen_index][1]]))
-        return QueensState(queen_positions)
+        queen_index, offset = divmod(move, self.side_length - 1)
+        column, row = queen_positions[queen_index]
+        # Offsets skip the queen's current row
+        new_row = offset + (offset >= row)
+        queen_positions[queen_index] = (column, new_row)
+        keys = zobrist_keys(self.side_length**2)
+        child = QueensState(queen_positions, side_length=self.side_length, reduce_symmetry=self.reduce_symmetry,
+                            zobrist=self.zobrist ^ keys[column*self.side_length + row] ^
+                            keys[column*self.side_length + new_row])
+        if self.line_cache is not None or self.origin is None:
+            # A child remembers a state whose lines are built, or are built from scratch (like the states astar
+            # unpacks from its node table), so children never hold on to chains of ancestors
+            child.origin = self
+            child.move = (column, row, new_row)
+        return child
+
+    def random_child(self):
+        return self.child_for_move(randrange(self.num_moves()))
+
+    def crossover(self, other):
+        # Columns left of a random cut point are taken from self and the remaining columns from other, so the
+        # child still has exactly one queen per column
+        cut = randrange(1, self.side_length)
+        return QueensState([queen for queen in self.queen_positions if queen[0] < cut] +
+                           [queen for queen in other.queen_positions if queen[0] >= cut],
+                           side_length=self.side_length, reduce_symmetry=self.reduce_symmetry)
+
+    def packed_bits(self):
+        return self.side_length**2
+
+    def pack(self):
+        ''' Packs the board into an int with one bit per square, indexed by col*side_length + row '''
+        packed = 0
+        for col, row in self.queen_positions:
+            packed |= 1 << (col*self.side_length + row)
+        return packed
+
+    def unpack(self, packed):
+        ''' Returns the board of the same size as self that pack() turned into packed '''
+        queen_positions = []
+        while packed:
+            square = (packed & -packed).bit_length() - 1
+            queen_positions.append(divmod(square, self.side_length))
+            packed &= packed - 1
+        return QueensState(queen_positions, side_length=self.side_length, reduce_symmetry=self.reduce_symmetry)
+
+    def canonical_pack(self):
+        ''' Returns the smallest pack() of the 8 rotations and reflections of the board. Every symmetry preserves the
+        attack count and maps the solutions onto themselves, so all images are equally far from a solution. '''
+        if self.canonical is None:
+            squares = [col*self.side_length + row for col, row in self.queen_positions]
+            self.canonical = min(sum([table[square] for square in squares])
+                                 for table in symmetry_bit_tables(self.side_length))
+        return self.canonical
+
+    def transformed(self, table):
+        return QueensState([table[col*self.side_length + row] for col, row in self.queen_positions],
+                           side_length=self.side_length, reduce_symmetry=self.reduce_symmetry)
 
     def queen_attacks(self):
 
@@ -96,67 +181,193 @@ class QueensState:
     def num_queen_attacks(self):
         return len(self.queen_attacks())
 
+    def attack_lines(self):
+        ''' Returns the queens on every occupied column, row and diagonal as {line: queens in (col, row) order}. A queen
+        only attacks its neighbours on a line, since it blocks the queens further along. A child made by child_for_move
+        updates the lines its queen left and entered in a copy of the lines of its origin, which are built first if
+        need be, so the siblings made in one expansion share one full build. '''
+        if self.line_cache is None:
+            origin = self.origin
+            if origin is not None:
+                column, row, new_row = self.move
+                lines = dict(origin.attack_lines())
+                queen = (column, row)
+                for line in queen_lines(column, row):
+                    queens = lines[line]
+                    index = queens.index(queen)
+                    if len(queens) == 1:
+                        del lines[line]
+                    else:
+                        lines[line] = queens[:index] + queens[index+1:]
+                queen = (column, new_row)
+                for line in queen_lines(column, new_row):
+                    queens = lines.get(line, ())
+                    index = bisect_left(queens, queen)
+                    lines[line] = queens[:index] + (queen,) + queens[index:]
+            else:
+                lines = {}
+                for queen in sorted(self.queen_positions):
+                    for line in queen_lines(*queen):
+                        lines[line] = lines.get(line, ()) + (queen,)
+            self.line_cache = lines
+            # The origin is no longer needed, so it can be freed before this state is
+            self.origin = None
+        return self.line_cache
+
     def __str__(self):
         return '\n'.join([' '.join(['.' if (col, row) not in self.queen_positions else '*' for col in range(
             self.side_length)]) for row in range(self.side_length)])
 
     def __hash__(self):
-        return hash(self.queen_positions)
+        if self.reduce_symmetry:
+            return hash(self.canonical_pack())
+        return self.zobrist
 
     def __eq__(self, other):
-        return self.queen_positions == other.queen_positions
+        if self.reduce_symmetry:
+            return self.canonical_pack() == other.canonical_pack()
+        # The positions are only compared when the hashes collide
+        return self.zobrist == other.zobrist and self.queen_positions == other.queen_positions
 
     def __lt__(self, other):
-        return self.f_cost < other.f_cost or (self.f_cost == other.f_cost and self.id > other.id)
+        # Searches that need a tie-break keep their own counter (see astar's node ids), so states share no counter
+        return self.f_cost < other.f_cost
 
 
-def all_8queen_states():
+def queen_lines(col, row):
+    # Keys of the column, row, diagonal and anti-diagonal through a square
+    return (0, col), (1, row), (2, col - row), (3, col + row)
+
+
+def h_num_attacks(state):
+    return state.num_queen_attacks()
+
+
+def h_distinct_attacks(state):
+    ''' Returns the number of groups of queens linked by attacks, found by union-find over the attacking neighbours
+    of attack_lines. No move is shared between groups, since every attack in a group holds until one of its two queens
+    moves (a queen moved in between would attack both). So this is a lower bound on the moves to a solution, unlike
+    num_queen_attacks. '''
+    parent = {}
+
+    def find(queen):
+        while parent[queen] != queen:
+            parent[queen] = parent[parent[queen]]
+            queen = parent[queen]
+        return queen
+
+    groups = 0
+    for queens in state.attack_lines().values():
+        for a, b in zip(queens, queens[1:]):
+            for queen in (a, b):
+                if queen not in parent:
+                    parent[queen] = queen
+                    groups += 1
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_a] = root_b
+                groups -= 1
+    return groups
+
+
+# Solutions found so far, by side length. They are only ever added, so threads read them without the lock.
+queen_solutions = {}
+queen_solutions_lock = Lock()
+
+
+def all_queen_states(side_length=8, verbose=False):
+    ''' Returns every solution of the side_length-queens problem. They are found once by depth-first search, by
+    whichever thread asks first, and then kept in queen_solutions. '''
+
+    if side_length in queen_solutions:
+        return queen_solutions[side_length]
+    with queen_solutions_lock:
+        if side_length not in queen_solutions:
+            queen_solutions[side_length] = tuple(find_queen_states(side_length, verbose))
+    return queen_solutions[side_length]
+
+
+def find_queen_states(side_length, verbose):
 
     result_counter = 0
 
-    def queen_dfs(queen_state=QueensState([])):
+    def queen_dfs(queen_state=QueensState([], side_length=side_length)):
         next_queen_col = len(queen_state.queen_positions)
-        if next_queen_col == 8:
+        if next_queen_col == side_length:
             nonlocal result_counter
             result_counter += 1
-            print('\rFound ' + str(result_counter) + ' results so far.', end='', flush=True)
+            if verbose:
+                print('\rFound ' + str(result_counter) + ' results so far.', end='', flush=True)
             return [queen_state]
 
         result = []
-        for row in range(8):
-            next_queen_state = QueensState(set(queen_state.queen_positions) | {(next_queen_col, row)})
+        for row in range(side_length):
+            next_queen_state = QueensState(set(queen_state.queen_positions) | {(next_queen_col, row)},
+                                           side_length=side_length)
             if next_queen_state.num_queen_attacks() == 0:
                 result += queen_dfs(next_queen_state)
         return result
 
+    return queen_dfs()
+
+
+def all_8queen_states():
     print('Finding all solutions to the 8-queens problem using recursive depth-first search.')
     start_time = timer()
-    results = queen_dfs()
+    results = all_queen_states(8, verbose=True)
     print('\nSearch for all solutions completed in ' + str(int((timer()-start_time)*1000)) + ' ms\n')
     return results
 
 
-all_solutions = all_8queen_states()
-
-
 class QueensProblem:
 
-    def __init__(self, start_state=None):
+    def __init__(self, start_state=None, reduce_symmetry=False, cost_function=h_num_attacks):
+        ''' reduce_symmetry makes states that are rotations or reflections of each other count as one state, so
+        searches that remember visited states (astar, local_beam_search) explore up to 8 times fewer of them.
+        cost_function(state) is the heuristic: h_num_attacks or the admissible h_distinct_attacks. '''
+        self.heuristic_function = cost_function
         if not start_state:
-            start_state = QueensState()
+            start_state = QueensState(reduce_symmetry=reduce_symmetry)
+        elif reduce_symmetry and not start_state.reduce_symmetry:
+            start_state = QueensState(start_state.queen_positions, side_length=start_state.side_length,
+                                      reduce_symmetry=True)
         self.start_state = start_state
 
     def goal_test(self, state):
         return state.num_queen_attacks() == 0
 
     def cost_function(self, state):
-        return state.num_queen_attacks()
+        return self.heuristic_function(state)
+
+    def canonical_symmetry(self):
+        ''' Returns the index of the column-preserving symmetry that maps the start state to its smallest form, along
+        with that form '''
+        n = self.start_state.side_length
+        forms = [tuple(sorted(table[col*n + row] for col, row in self.start_state.queen_positions))
+                 for table in symmetry_tables(n)[:4]]
+        index = min(range(4), key=forms.__getitem__)
+        return index, forms[index]
+
+    def canonical_key(self):
+        # The heuristic is part of the key, since the inadmissible h_num_attacks and the admissible h_distinct_attacks
+        # lead A* to paths of different lengths
+        return 'queens:' + self.heuristic_function.__name__ + ':' + str(self.start_state.side_length) + ':' + \
+            str(self.canonical_symmetry()[1])
+
+    def encode_path(self, path):
+        table = symmetry_tables(self.start_state.side_length)[self.canonical_symmetry()[0]]
+        return [sorted(state.transformed(table).queen_positions) for state in path]
+
+    def decode_path(self, encoded_path):
+        table = symmetry_tables(self.start_state.side_length)[self.canonical_symmetry()[0]]
+        return [QueensState([tuple(queen) for queen in state], side_length=self.start_state.side_length,
+                            reduce_symmetry=self.start_state.reduce_symmetry).transformed(
+            table) for state in encoded_path]
 
     def optimal_solution_cost(self):
         ''' Returns smallest number of queens that need to be moved to get to an optimal solution from queens_state'''
-        global all_solutions
         differences = [len(self.start_state.queen_positions - optimal_state.queen_positions) for optimal_state in
-                       all_solutions]
+                       all_queen_states(self.start_state.side_length)]
         return min(differences)
 
 
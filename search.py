@@ -1,30 +1,230 @@
-from random import choice, random
-from math import exp
+from random import Random, choice, choices, random, randrange, shuffle
+from math import exp, inf
 from heapq import heappop, heappush
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import islice
+from hashlib import sha1
+import os
+import tracemalloc
 
 
-def steepest_ascent_hill_climb(problem, allow_sideways=False, max_sideways=100):
+def current_memory():
+    ''' Returns the bytes currently traced by tracemalloc when it is running, else the resident set size read from
+    /proc, or None where neither is available '''
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
 
-    def get_best_child(node, problem):
-        children = node.get_children()
-        children_cost = [problem.cost_function(child) for child in children]
-        min_cost = min(children_cost)
-        # If best child is not chosen randomly from the set of children that have the lowest number of attacks,
-        # then algorithm will get stuck flip-flopping between two non-random best children when sideways moves are
-        # allowed
-        best_child = choice([child for child_index, child in enumerate(children) if children_cost[
-            child_index] == min_cost])
-        return best_child
+
+class SearchBudget:
+    ''' Wall-clock, node and memory limits shared by the solvers. The clock and memory are only read every
+    check_interval nodes, so checking the budget in a hot loop costs little more than an integer comparison.
+    max_memory is the number of bytes a solve may add to current_memory() after the budget was created. Once spend()
+    has returned True, exhausted names the limit that was hit. '''
+
+    def __init__(self, time_limit=None, max_nodes=None, check_interval=64, max_memory=None):
+        self.start_time = timer()
+        self.deadline = None if time_limit is None else self.start_time + time_limit
+        self.max_nodes = max_nodes
+        self.check_interval = check_interval
+        self.nodes = 0
+        self.next_check = check_interval if max_nodes is None else min(check_interval, max_nodes)
+        self.memory_limit = None
+        if max_memory is not None and current_memory() is not None:
+            self.memory_limit = current_memory() + max_memory
+        self.exhausted = None
+
+    def spend(self, nodes=1):
+        ''' Records nodes against the budget and returns True once the budget has run out '''
+        self.nodes += nodes
+        if self.nodes < self.next_check:
+            return False
+
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            self.exhausted = 'nodes'
+        elif self.deadline is not None and timer() >= self.deadline:
+            self.exhausted = 'time'
+        elif self.memory_limit is not None and current_memory() >= self.memory_limit:
+            self.exhausted = 'memory'
+        if self.exhausted:
+            return True
+
+        self.next_check = self.nodes + self.check_interval
+        if self.max_nodes is not None:
+            self.next_check = min(self.next_check, self.max_nodes)
+        return False
+
+    def consumed(self):
+        return {'nodes': self.nodes, 'time': (timer()-self.start_time)*1000}
+
+
+def zero_clock():
+    return 0
+
+
+class Instrumentation:
+    ''' Counters and per-phase timers for solver runs. Solvers keep their counts in local variables and hand them over
+    once per run, and phases are only timed when timers is True, so a solver run without instrumentation (or with
+    timers off) does no extra work per node. Runs that share an Instrumentation, such as the climbs of
+    random_restart_hill_climb, add up their counts. '''
+
+    def __init__(self, timers=True):
+        self.timers = timers
+        self.counters = {}
+        self.phase_times = {}
+
+    def clock(self):
+        ''' Returns the clock a solver reads around its phases '''
+        return timer if self.timers else zero_clock
+
+    def record(self, counters, phase_times):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.timers:
+            for name, seconds in phase_times.items():
+                self.phase_times[name] = self.phase_times.get(name, 0) + seconds
+
+    def stats(self):
+        ''' Returns the counters and the phase times in ms, the latter under '<phase>_ms' '''
+        stats = dict(self.counters)
+        stats.update({name + '_ms': seconds*1000 for name, seconds in self.phase_times.items()})
+        return stats
+
+
+def report(result, instrumentation, counters, phase_times):
+    ''' Hands a finished run's counters and phase times to instrumentation, if any, and attaches its stats to result '''
+    if instrumentation is not None:
+        instrumentation.record(counters, phase_times)
+        result['stats'] = instrumentation.stats()
+    return result
+
+
+def timeout_result(problem, path, best_state, best_cost, budget):
+    return {'outcome': 'timeout',
+            'reason': budget.exhausted,
+            'solution': path,
+            'best_state': best_state,
+            'best_cost': best_cost,
+            'budget': budget.consumed(),
+            'problem': problem}
+
+
+# Seed of the Zobrist keys. Fixed, so every process derives the same hashes for the same states.
+ZOBRIST_SEED = 20180101
+
+# Zobrist keys already drawn, by table size, shared by all threads
+zobrist_tables = {}
+
+
+def zobrist_keys(count):
+    ''' Returns count random 64-bit keys, one per (piece, square) pair of a board. A state hashes to the XOR of the
+    keys of its pieces' squares, so moving a piece changes the hash by two XORs: out of the old square, into the new.
+    The keys come from a fixed seed and only depend on count. '''
+    if count not in zobrist_tables:
+        rng = Random(ZOBRIST_SEED + count)
+        # Assigning the finished tuple is atomic, so a thread never sees a partial table
+        zobrist_tables[count] = tuple(rng.getrandbits(64) for _ in range(count))
+    return zobrist_tables[count]
+
+
+def unsolvable_result(problem):
+    ''' Returns a result rejecting problem if it can tell up front that it has no solution, otherwise None '''
+    if hasattr(problem, 'is_solvable') and not problem.is_solvable():
+        return {'outcome': 'unsolvable', 'solution': [problem.start_state], 'problem': problem}
+    return None
+
+
+def batch_costs(problem, states):
+    ''' Returns the cost of every state, in one call when problem provides cost_function_batch(states) '''
+    if hasattr(problem, 'cost_function_batch'):
+        return problem.cost_function_batch(states)
+    return [problem.cost_function(state) for state in states]
+
+
+def consults_cache(solver):
+    ''' Lets solver take cache=SolutionCache(...). A cached solution of an equivalent instance is returned without
+    searching, and new successful solutions are stored. Counters such as total_nodes are reported as 0 on a hit. '''
+
+    @wraps(solver)
+    def cached_solver(problem, *args, cache=None, **kwargs):
+        if cache is None:
+            return solver(problem, *args, **kwargs)
+
+        # Solutions are only shared between calls that use the same solver options
+        options = [(key, value) for key, value in sorted(kwargs.items())
+                   if key not in ('budget', 'pool', 'instrumentation')]
+        name = solver.__name__
+        if args or options:
+            name += ':' + sha1(repr((args, options)).encode()).hexdigest()[:16]
+
+        hit = cache.lookup(name, problem)
+        if hit is not None:
+            path, stats = hit
+            result = {'outcome': 'success', 'solution': path, 'problem': problem, 'cached': True,
+                      'cached_stats': stats}
+            result.update({key: 0 for key in stats})
+            return result
+
+        result = solver(problem, *args, **kwargs)
+        if result['outcome'] == 'success':
+            cache.store(name, problem, result['solution'],
+                        {key: result[key] for key in ('total_nodes',) if key in result})
+        return result
+
+    return cached_solver
+
+
+@consults_cache
+def steepest_ascent_hill_climb(problem, allow_sideways=False, max_sideways=100, budget=None, instrumentation=None):
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        return rejected
 
     node = problem.start_state
     node_cost = problem.cost_function(node)
     path = []
     sideways_moves = 0
+    budget = budget or SearchBudget()
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    expansions = children_generated = total_sideways_moves = 0
+    expand_time = evaluate_time = 0
+
+    def finish(result):
+        return report(result, instrumentation,
+                      {'expansions': expansions, 'children': children_generated,
+                       'evaluations': children_generated + 1, 'sideways_moves': total_sideways_moves},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
 
     while True:
         path.append(node)
-        best_child = get_best_child(node, problem)
-        best_child_cost = problem.cost_function(best_child)
+        if budget.spend():
+            return finish(timeout_result(problem, path, node, node_cost, budget))
+
+        started = clock()
+        children = node.get_children()
+        expanded = clock()
+        children_cost = batch_costs(problem, children)
+        evaluated = clock()
+        expand_time += expanded - started
+        evaluate_time += evaluated - expanded
+        expansions += 1
+        children_generated += len(children)
+
+        best_child_cost = min(children_cost)
+        # If best child is not chosen randomly from the set of children that have the lowest number of attacks,
+        # then algorithm will get stuck flip-flopping between two non-random best children when sideways moves are
+        # allowed
+        best_child = choice([child for child_index, child in enumerate(children) if children_cost[
+            child_index] == best_child_cost])
 
         if best_child_cost > node_cost:
             break
@@ -33,121 +233,843 @@ def steepest_ascent_hill_climb(problem, allow_sideways=False, max_sideways=100):
                 break
             else:
                 sideways_moves += 1
+                total_sideways_moves += 1
         else:
             sideways_moves = 0
         node = best_child
         node_cost = best_child_cost
 
-    return {'outcome': 'success' if problem.goal_test(node) else 'failure',
-            'solution': path,
-            'problem': problem}
+    return finish({'outcome': 'success' if problem.goal_test(node) else 'failure',
+                   'solution': path,
+                   'problem': problem})
+
+
+class NodeTable:
+    ''' Struct-of-arrays store of search nodes. A node is an integer id into growable arrays holding its packed state,
+    path cost, parent id and the index of the action (child) that generated it, about 16 bytes per node. An
+    open-addressing index, itself an array of node ids, maps each packed state to its most recent node. A node is
+    closed once it has been expanded or superseded by a cheaper node for the same state. With separate_keys, the index
+    is keyed on a key given for each node (e.g. a canonical form shared by symmetric states) instead of its packed
+    state, so equivalent states share one entry while every node keeps its actual state for path reconstruction. '''
 
+    def __init__(self, packed_bits, capacity=1024, separate_keys=False):
+        self.states = array('Q') if packed_bits <= 64 else []
+        self.keys = (array('Q') if packed_bits <= 64 else []) if separate_keys else self.states
+        self.path_costs = array('H')
+        self.parents = array('i')
+        self.actions = array('H')
+        self.closed = bytearray()
+        self.slots = array('i', [-1]) * capacity
+        self.shift = 64 - (capacity-1).bit_length()
+        self.used_slots = 0
 
-def astar(problem):
+    def __len__(self):
+        return len(self.path_costs)
 
-    path_costs = {problem.start_state: problem.start_state.path_cost}
-    frontier = [problem.start_state]
-    explored = set()
-    result = None
+    def slot(self, key):
+        ''' Returns the index slot that holds, or would hold, the node for key '''
+        slots = self.slots
+        keys = self.keys
+        mask = len(slots) - 1
+        slot = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        while True:
+            node_id = slots[slot]
+            if node_id < 0 or keys[node_id] == key:
+                return slot
+            slot = (slot+1) & mask
+
+    def add(self, packed, path_cost, parent, action, slot=None, key=None):
+        node_id = len(self.path_costs)
+        self.states.append(packed)
+        if key is None:
+            key = packed
+        if self.keys is not self.states:
+            self.keys.append(key)
+        self.path_costs.append(path_cost)
+        self.parents.append(parent)
+        self.actions.append(action)
+        self.closed.append(0)
+
+        if slot is None:
+            slot = self.slot(key)
+        if self.slots[slot] < 0:
+            self.used_slots += 1
+        self.slots[slot] = node_id
+        if self.used_slots*2 > len(self.slots):
+            self.grow()
+        return node_id
+
+    def grow(self):
+        latest = [node_id for node_id in self.slots if node_id >= 0]
+        self.slots = array('i', [-1]) * (len(self.slots)*2)
+        self.shift -= 1
+        for node_id in latest:
+            self.slots[self.slot(self.keys[node_id])] = node_id
+
+    def path(self, node_id):
+        ''' Returns the packed states from the root to node_id '''
+        packed_path = []
+        while node_id >= 0:
+            packed_path.append(self.states[node_id])
+            node_id = self.parents[node_id]
+        packed_path.reverse()
+        return packed_path
+
+
+@consults_cache
+def astar(problem, weight=1, mode='weighted', anticipated_depth=None, budget=None, instrumentation=None):
+    ''' weight > 1 trades optimality for fewer expansions. mode chooses how the weight is applied:
+        'weighted': f = g + weight*h (plain A* when weight is 1)
+        'dynamic':  Pohl's dynamic weighting, f = g + (1 + (weight-1)*max(0, 1 - g/anticipated_depth))*h, which
+                    searches greedily near the start and optimally near the anticipated solution depth
+        'focal':    A*epsilon, which expands the open node with the smallest h among those with
+                    g + h <= weight * min(g + h)
+    With an admissible h every mode returns a path costing at most weight times the optimum. 'bound' in the result is
+    the ratio of the solution cost to the best lower bound known when the search stopped.
+    States must provide pack(), packed_bits() and unpack(packed); nodes are kept in a NodeTable rather than as state
+    objects. '''
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        rejected['total_nodes'] = 0
+        return rejected
+
+    start = problem.start_state
+    start_cost = problem.cost_function(start)
+    anticipated_depth = anticipated_depth or max(start_cost, 1)
+    # States that reduce symmetry are indexed on their canonical form, so symmetric copies count as one state
+    reduced = getattr(start, 'reduce_symmetry', False)
+    nodes = NodeTable(start.packed_bits(), separate_keys=reduced)
+    nodes.add(start.pack(), 0, -1, 0, key=start.canonical_pack() if reduced else None)
     total_nodes = 1
+    budget = budget or SearchBudget()
+    best_id = 0
+    best_cost = start_cost
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    expansions = 0
+    evaluations = 1
+    expand_time = evaluate_time = queue_time = 0
+
+    def finish(result):
+        return report(result, instrumentation,
+                      {'expansions': expansions, 'children': total_nodes - 1, 'evaluations': evaluations},
+                      {'expand': expand_time, 'evaluate': evaluate_time, 'queue': queue_time})
+
+    # Open entries are (priority, -node id, h), so ties are broken in favour of the most recently generated node.
+    # Entries for nodes that have since been closed are skipped when they are reached.
+    if mode == 'focal':
+        open_list = []
+        focal = []
+        focal_bound = -1
+
+        def push(node_id, g, h):
+            entry = (g+h, -node_id, h)
+            insort(open_list, entry)
+            if g+h <= focal_bound:
+                heappush(focal, (h, entry))
 
-    while not result:
-        node = heappop(frontier)
-        explored.add(node)
+        def pop():
+            nonlocal focal_bound
+            while open_list and nodes.closed[-open_list[0][1]]:
+                del open_list[0]
+            if not open_list:
+                return None
+
+            bound = weight*open_list[0][0]
+            if bound > focal_bound:
+                for entry in open_list[bisect_right(open_list, (focal_bound, inf)):
+                                       bisect_right(open_list, (bound, inf))]:
+                    heappush(focal, (entry[2], entry))
+                focal_bound = bound
+
+            while True:
+                h, entry = heappop(focal)
+                if not nodes.closed[-entry[1]]:
+                    break
+            del open_list[bisect_left(open_list, entry)]
+            return entry
+
+        open_entries = open_list
+    else:
+        frontier = []
+
+        def push(node_id, g, h):
+            if mode == 'dynamic':
+                priority = g + (1 + (weight-1)*max(0, 1 - g/anticipated_depth))*h
+            else:
+                priority = g + weight*h
+            heappush(frontier, (priority, -node_id, h))
+
+        def pop():
+            while frontier:
+                entry = heappop(frontier)
+                if not nodes.closed[-entry[1]]:
+                    return entry
+            return None
+
+        open_entries = frontier
+
+    def unpack_path(node_id):
+        return [start] + [start.unpack(packed) for packed in nodes.path(node_id)[1:]]
+
+    push(0, 0, start_cost)
+
+    while True:
+        started = clock()
+        entry = pop()
+        popped = clock()
+        queue_time += popped - started
+        if entry is None:
+            return finish({'outcome': 'failed', 'solution': [start], 'total_nodes': total_nodes, 'problem': problem})
+
+        node_id = -entry[1]
+        node_cost = entry[2]
+        nodes.closed[node_id] = 1
+        node = start if node_id == 0 else start.unpack(nodes.states[node_id])
 
         if problem.goal_test(node):
-            result = node
             break
 
+        if node_cost < best_cost:
+            best_id = node_id
+            best_cost = node_cost
+
+        children = node.get_children()
+        expanded = clock()
+        expand_time += expanded - popped
+        expansions += 1
+        total_nodes += len(children)
+
+        if budget.spend(len(children)):
+            result = timeout_result(problem, unpack_path(best_id), None, best_cost, budget)
+            result['best_state'] = result['solution'][-1]
+            result['total_nodes'] = total_nodes
+            return finish(result)
+
+        child_path_cost = nodes.path_costs[node_id] + 1
+        accepted = []
+        for action, child in enumerate(children):
+            packed = child.pack()
+            key = child.canonical_pack() if reduced else packed
+            existing = nodes.slots[nodes.slot(key)]
+            if existing >= 0:
+                if nodes.closed[existing] or nodes.path_costs[existing] <= child_path_cost:
+                    continue
+                nodes.closed[existing] = 1
+            accepted.append((action, child, packed, key))
+
+        # The surviving children are scored together so that problems with cost_function_batch pay one call per node.
+        # Slots are looked up again on insertion, since siblings added first may take the slot a child probed to.
+        checked = clock()
+        children_cost = batch_costs(problem, [child for _, child, _, _ in accepted])
+        evaluated = clock()
+        evaluations += len(accepted)
+        for (action, child, packed, key), child_cost in zip(accepted, children_cost):
+            push(nodes.add(packed, child_path_cost, node_id, action, key=key), child_path_cost, child_cost)
+        evaluate_time += evaluated - checked
+        queue_time += checked - expanded + clock() - evaluated
+
+    solution_cost = nodes.path_costs[node_id]
+    lower_bound = min([solution_cost] + [nodes.path_costs[-open_id] + h for _, open_id, h in open_entries
+                                         if not nodes.closed[-open_id]])
+
+    return finish({'outcome': 'success', 'solution': unpack_path(node_id), 'total_nodes': total_nodes,
+                   'bound': solution_cost / lower_bound if lower_bound else 1, 'problem': problem})
+
+
+def reverse_costs(problem, states):
+    ''' Returns every state's estimated distance back to the start, in one call when problem provides
+    reverse_cost_function_batch(states) '''
+    if hasattr(problem, 'reverse_cost_function_batch'):
+        return problem.reverse_cost_function_batch(states)
+    return [problem.reverse_cost_function(state) for state in states]
+
+
+def bidirectional_astar(problem, budget=None, instrumentation=None):
+    ''' Front-to-end bidirectional A*. One search runs forward from the start with problem.cost_function and one runs
+    backward from problem.goal_state with problem.reverse_cost_function, the estimated distance back to the start.
+    Each generated state is looked up in the other direction's path costs, and the cheapest meeting found so far
+    bounds the solution cost from above. The direction with the smaller open list expands next. As in BS*, states
+    already closed by the other direction are not expanded and children with g + h at or above the bound are not
+    kept. The search stops once the bound is no larger than the smallest f of either direction. With admissible
+    heuristics nothing cheaper can remain then, so the solution is optimal. Moves must be reversible and cost 1 (as in
+    sliding puzzles); states must provide pack() and unpack(packed). Problems without a goal state to search back from
+    (e.g. queens) get outcome 'unsupported'. '''
+
+    if not hasattr(problem, 'goal_state') or not hasattr(problem, 'reverse_cost_function'):
+        return {'outcome': 'unsupported', 'reason': 'bidirectional search needs a goal_state and reverse_cost_function',
+                'solution': [problem.start_state], 'total_nodes': 0, 'problem': problem}
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        rejected['total_nodes'] = 0
+        return rejected
+
+    start = problem.start_state
+    goal = problem.goal_state
+    if problem.goal_test(start):
+        return report({'outcome': 'success', 'solution': [start], 'total_nodes': 1, 'bound': 1, 'problem': problem},
+                      instrumentation, {}, {})
+
+    budget = budget or SearchBudget()
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    expansions = [0, 0]
+    evaluations = 2
+    total_nodes = 2
+    expand_time = evaluate_time = 0
+
+    # Index 0 is the forward search and 1 the backward one
+    roots = [start, goal]
+    root_packed = [start.pack(), goal.pack()]
+    path_costs = [{root_packed[0]: 0}, {root_packed[1]: 0}]
+    parents = [{root_packed[0]: None}, {root_packed[1]: None}]
+    closed = [set(), set()]
+    # Entries are (f, -g, order, packed state); entries whose g has since improved, or whose state has been closed,
+    # are skipped when they reach the top
+    frontiers = [[(problem.cost_function(start), 0, 0, root_packed[0])],
+                 [(problem.reverse_cost_function(goal), 0, 1, root_packed[1])]]
+    order = 2
+    heuristics = [batch_costs, reverse_costs]
+    best_cost = inf
+    meeting = None
+
+    def finish(result):
+        result['total_nodes'] = total_nodes
+        return report(result, instrumentation,
+                      {'expansions': sum(expansions), 'forward_expansions': expansions[0],
+                       'backward_expansions': expansions[1], 'children': total_nodes - 2,
+                       'evaluations': evaluations},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
+
+    def half_path(side, packed):
+        path = []
+        while packed is not None:
+            path.append(packed)
+            packed = parents[side][packed]
+        return path
+
+    def unpack_path():
+        packed_path = half_path(0, meeting)[::-1] + half_path(1, meeting)[1:]
+        return [start] + [start.unpack(packed) for packed in packed_path[1:-1]] + [goal]
+
+    while True:
+        for side in (0, 1):
+            frontier = frontiers[side]
+            while frontier and (frontier[0][3] in closed[side] or -frontier[0][1] != path_costs[side][frontier[0][3]]):
+                heappop(frontier)
+        # Once either direction has run out of states, every path between start and goal has been seen
+        if not frontiers[0] or not frontiers[1] or best_cost <= max(frontiers[0][0][0], frontiers[1][0][0]):
+            break
+
+        if meeting is None:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        else:
+            # Only one direction's smallest f has to reach the bound to prove it optimal, so push the closer one
+            side = 0 if frontiers[0][0][0] >= frontiers[1][0][0] else 1
+        packed = heappop(frontiers[side])[3]
+        closed[side].add(packed)
+        if packed in closed[1-side]:
+            continue
+
+        started = clock()
+        node = roots[side] if packed == root_packed[side] else start.unpack(packed)
         children = node.get_children()
+        expanded = clock()
+        expansions[side] += 1
         total_nodes += len(children)
 
+        if budget.spend(len(children)):
+            if meeting is None:
+                result = timeout_result(problem, [start], start, problem.cost_function(start), budget)
+            else:
+                result = timeout_result(problem, unpack_path(), goal, 0, budget)
+            return finish(result)
+
+        child_path_cost = path_costs[side][packed] + 1
+        accepted = []
         for child in children:
+            child_packed = child.pack()
+            if child_packed not in closed[side] and child_path_cost < path_costs[side].get(child_packed, inf):
+                accepted.append((child, child_packed))
 
-            child.parent = node
-            child.path_cost = node.path_cost+1
-            child.f_cost = child.path_cost + problem.cost_function(child)
+        children_cost = heuristics[side](problem, [child for child, _ in accepted])
+        evaluations += len(accepted)
+        for (child, child_packed), child_cost in zip(accepted, children_cost):
+            other_cost = path_costs[1-side].get(child_packed)
+            improves = other_cost is not None and child_path_cost + other_cost < best_cost
+            if child_path_cost + child_cost >= best_cost and not improves:
+                continue
+            path_costs[side][child_packed] = child_path_cost
+            parents[side][child_packed] = packed
+            if improves:
+                best_cost = child_path_cost + other_cost
+                meeting = child_packed
+            if child_path_cost + child_cost < best_cost:
+                heappush(frontiers[side], (child_path_cost + child_cost, -child_path_cost, order, child_packed))
+                order += 1
+        evaluate_time += clock() - expanded
+        expand_time += expanded - started
 
-            if child not in frontier:
-                if child not in explored:
-                    path_costs[child] = child.path_cost
-                    heappush(frontier, child)
-            elif child.path_cost < path_costs[child]:
-                frontier.remove(child)
-                heappush(frontier, child)
-                path_costs[child] = child.path_cost
+    if meeting is None:
+        return finish({'outcome': 'failed', 'solution': [start], 'problem': problem})
+    return finish({'outcome': 'success', 'solution': unpack_path(), 'bound': 1, 'problem': problem})
 
-        if not frontier:
-            return {'outcome': 'failed'}
 
-    path = []
-    while result:
-        path.append(result)
-        result = result.parent
-    path.reverse()
+# Heuristic values learned by lrta_star, by goal and then by packed state. They persist across calls, so repeated solves
+# towards the same goal start from what earlier solves learned. Threads may share them: values only go up, and a lost
+# update leaves a smaller value that is still a lower bound.
+learned_heuristics = {}
+
+
+def lrta_star(problem, lookahead=1, decision_time=None, max_moves=None, learned=None, budget=None,
+              instrumentation=None):
+    ''' Real-time search: LRTA* for lookahead=1 and RTAA* for larger lookahead. Each decision runs an A* search of at
+    most lookahead expansions from the current state, stopping early once decision_time seconds have passed. The h of
+    every expanded state is raised to f_min - g, where f_min is the smallest f on the search frontier, and the moves
+    to that frontier state are committed. With max_moves, returns with outcome 'partial' once that many moves have been
+    committed. learned maps a goal to the {packed state: h} values learned so far and defaults to learned_heuristics;
+    pass {} to start from the plain heuristic. 'decision_times' in the result lists the ms each decision took.
+    States must provide pack(). '''
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        rejected['total_nodes'] = 0
+        return rejected
 
-    return {'outcome': 'success', 'solution': path, 'total_nodes': total_nodes, 'problem': problem}
+    goal = getattr(problem, 'goal_state', None)
+    table = (learned_heuristics if learned is None else learned).setdefault(
+        None if goal is None else (goal.packed_bits(), goal.pack()), {})
+    node = problem.start_state
+    path = [node]
+    budget = budget or SearchBudget()
+    decision_times = []
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    expansions = 0
+    total_nodes = 1
+    evaluations = updates = 0
+    expand_time = evaluate_time = 0
+
+    def finish(result):
+        result['total_nodes'] = total_nodes
+        result['decision_times'] = decision_times
+        return report(result, instrumentation,
+                      {'expansions': expansions, 'children': total_nodes - 1, 'evaluations': evaluations,
+                       'decisions': len(decision_times), 'updates': updates},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
+
+    def heuristic(states, packed_states):
+        # Learned values are used where there are any, and the rest are scored in one batch
+        nonlocal evaluations
+        missing = [state for state, packed in zip(states, packed_states) if packed not in table]
+        costs = iter(batch_costs(problem, missing))
+        evaluations += len(missing)
+        return [table[packed] if packed in table else next(costs) for packed in packed_states]
+
+    while not problem.goal_test(node):
+        if max_moves is not None and len(path) > max_moves:
+            return finish({'outcome': 'partial', 'solution': path, 'problem': problem})
+
+        decision_started = timer()
+        deadline = None if decision_time is None else decision_started + decision_time
+        root = node.pack()
+        states = {root: node}
+        path_costs = {root: 0}
+        parents = {root: None}
+        h = {root: heuristic([node], [root])[0]}
+        closed = []
+        closed_set = set()
+        # Entries are (f, -g, order, packed); ties go to the deeper state, then to the one generated first
+        frontier = [(h[root], 0, 0, root)]
+        generated = 1
+        target = None
+
+        while frontier:
+            f, negative_g, _, packed = frontier[0]
+            if packed in closed_set or -negative_g != path_costs[packed]:
+                heappop(frontier)
+                continue
+            if len(closed) == lookahead or (closed and (problem.goal_test(states[packed]) or
+                                                        deadline is not None and timer() >= deadline)):
+                target = packed
+                break
+            heappop(frontier)
+            closed.append(packed)
+            closed_set.add(packed)
+
+            started = clock()
+            children = states[packed].get_children()
+            expanded = clock()
+            expansions += 1
+            total_nodes += len(children)
+            if budget.spend(len(children)):
+                decision_times.append((timer()-decision_started)*1000)
+                return finish(timeout_result(problem, path, node, h[root], budget))
+
+            child_path_cost = path_costs[packed] + 1
+            accepted = [(child, child.pack()) for child in children]
+            accepted = [(child, child_packed) for child, child_packed in accepted
+                        if child_packed not in path_costs or child_path_cost < path_costs[child_packed]]
+            children_cost = heuristic([child for child, _ in accepted], [child_packed for _, child_packed in accepted])
+            for (child, child_packed), child_cost in zip(accepted, children_cost):
+                states[child_packed] = child
+                path_costs[child_packed] = child_path_cost
+                parents[child_packed] = packed
+                h[child_packed] = child_cost
+                closed_set.discard(child_packed)
+                heappush(frontier, (child_path_cost + child_cost, -child_path_cost, generated, child_packed))
+                generated += 1
+            evaluate_time += clock() - expanded
+            expand_time += expanded - started
+
+        if target is None:
+            decision_times.append((timer()-decision_started)*1000)
+            return finish({'outcome': 'failed', 'solution': path, 'problem': problem})
 
+        # Learning: every expanded state is at least as far from the goal as the best frontier state's f says
+        f_min = path_costs[target] + h[target]
+        for packed in closed:
+            if f_min - path_costs[packed] > h[packed]:
+                table[packed] = f_min - path_costs[packed]
+                updates += 1
 
-def first_choice_hill_climb(problem, num_successors=100, allow_sideways=False):
+        moves = []
+        packed = target
+        while packed != root:
+            moves.append(states[packed])
+            packed = parents[packed]
+        moves.reverse()
+        if max_moves is not None:
+            moves = moves[:max_moves - len(path) + 1]
+        path.extend(moves)
+        node = path[-1]
+        decision_times.append((timer()-decision_started)*1000)
+
+    return finish({'outcome': 'success', 'solution': path, 'problem': problem})
+
+
+def lrta_star_trials(problem, trials=10, learned=None, **kwargs):
+    ''' Solves problem trials times with lrta_star, sharing one learned table (a fresh one unless learned is given),
+    and returns the result of every trial plus 'converged_after', the number of trials after which a trial learned
+    nothing new, or None if every trial did. With an admissible heuristic, a trial that learns nothing follows an
+    optimal path. '''
+    learned = {} if learned is None else learned
+    results = []
+    converged_after = None
+    for trial in range(trials):
+        instrumentation = Instrumentation(timers=False)
+        result = lrta_star(problem, learned=learned, instrumentation=instrumentation, **kwargs)
+        results.append(result)
+        if result['outcome'] == 'success' and result['stats']['updates'] == 0:
+            converged_after = trial
+            break
+    return {'trials': results, 'converged_after': converged_after}
+
+
+def shuffled_moves(num_moves):
+    ''' Yields the move indices range(num_moves) in random order without repeats. The Fisher-Yates shuffle is run
+    lazily, one swap per index drawn, with the swapped positions kept in a dict, so drawing k moves costs O(k) however
+    large the neighbourhood is. '''
+    swapped = {}
+    for drawn in range(num_moves):
+        pick = randrange(drawn, num_moves)
+        yield swapped.get(pick, pick)
+        swapped[pick] = swapped.get(drawn, drawn)
+
+
+@consults_cache
+def first_choice_hill_climb(problem, num_successors=100, allow_sideways=False, budget=None, instrumentation=None):
+    ''' Moves to the first random child that is better than the current state (or as good, with allow_sideways),
+    trying at most num_successors children per state. Children are drawn without replacement, so a state whose
+    neighbourhood is smaller than num_successors is left after every child was tried once: it is then a true local
+    minimum. The draws this saves over num_successors are counted as evaluations_saved. '''
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        return rejected
 
     child = problem.start_state
     child_cost = problem.cost_function(child)
     path = []
     successor_found = True
+    budget = budget or SearchBudget()
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    children_generated = sideways_moves = evaluations_saved = exhausted = 0
+    expand_time = evaluate_time = 0
+
+    def finish(result):
+        return report(result, instrumentation,
+                      {'expansions': len(path), 'children': children_generated,
+                       'evaluations': children_generated + 1, 'sideways_moves': sideways_moves,
+                       'evaluations_saved': evaluations_saved, 'exhausted_neighbourhoods': exhausted},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
 
     while successor_found:
         node = child
         node_cost = child_cost
         path.append(node)
         successor_found = False
-        for _ in range(num_successors):
+        num_moves = node.num_moves()
+        for move in islice(shuffled_moves(num_moves), num_successors):
+
+            if budget.spend():
+                return finish(timeout_result(problem, path, node, node_cost, budget))
 
-            child = node.random_child()
+            started = clock()
+            child = node.child_for_move(move)
+            expanded = clock()
             child_cost = problem.cost_function(child)
+            expand_time += expanded - started
+            evaluate_time += clock() - expanded
+            children_generated += 1
 
             if (child_cost < node_cost) or (allow_sideways and child_cost == node_cost):
+                sideways_moves += child_cost == node_cost
                 successor_found = True
                 break
 
-    return {'outcome': 'success' if problem.goal_test(node) else 'failure',
-            'solution': path,
-            'problem': problem}
+        if not successor_found and num_moves < num_successors:
+            exhausted += 1
+            evaluations_saved += num_successors - num_moves
+
+    return finish({'outcome': 'success' if problem.goal_test(node) else 'failure',
+                   'solution': path,
+                   'problem': problem})
 
 
-def random_restart_hill_climb(random_problem_generator, num_restarts=100, allow_sideways=False, max_sideways=100):
+def random_restart_hill_climb(random_problem_generator, num_restarts=100, allow_sideways=False, max_sideways=100,
+                              budget=None, instrumentation=None):
+    ''' The climbs report into instrumentation as they finish, so its stats cover all of them '''
 
     path = []
+    budget = budget or SearchBudget()
+    best = None
+    best_cost = None
 
-    for _ in range(num_restarts):
+    for restart in range(num_restarts):
 
         result = steepest_ascent_hill_climb(random_problem_generator(), allow_sideways=allow_sideways,
-                                            max_sideways=max_sideways)
+                                            max_sideways=max_sideways, budget=budget, instrumentation=instrumentation)
         path += result['solution']
 
         if result['outcome'] == 'success':
             break
 
+        if result['outcome'] == 'timeout':
+            if best is None or result['best_cost'] < best_cost:
+                best = result['best_state']
+                best_cost = result['best_cost']
+            return report(timeout_result(result['problem'], path, best, best_cost, budget), instrumentation,
+                          {'restarts': restart}, {})
+
+        restart_cost = result['problem'].cost_function(result['solution'][-1])
+        if best is None or restart_cost < best_cost:
+            best = result['solution'][-1]
+            best_cost = restart_cost
+
     result['solution'] = path
-    return result
+    return report(result, instrumentation, {'restarts': restart}, {})
 
 
-def simulated_annealing(problem, temperature_schedule):
+@consults_cache
+def simulated_annealing(problem, temperature_schedule, budget=None, instrumentation=None):
+    rejected = unsolvable_result(problem)
+    if rejected:
+        return rejected
+
     node = problem.start_state
     node_cost = problem.cost_function(node)
     path = [node]
+    budget = budget or SearchBudget()
+    best = node
+    best_cost = node_cost
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    children_generated = 0
+    expand_time = evaluate_time = 0
+
+    def finish(result):
+        # Every move that was not accepted was rejected, and every accepted move extended the path
+        return report(result, instrumentation,
+                      {'children': children_generated, 'evaluations': children_generated + 1,
+                       'accepted_moves': len(path) - 1, 'rejected_moves': children_generated - len(path) + 1},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
 
     for t in temperature_schedule:
 
+        if budget.spend():
+            return finish(timeout_result(problem, path, best, best_cost, budget))
+
+        started = clock()
         child = node.random_child()
+        expanded = clock()
         child_cost = problem.cost_function(child)
+        expand_time += expanded - started
+        evaluate_time += clock() - expanded
+        children_generated += 1
         cost_diff = node_cost - child_cost
 
         if (cost_diff > 0) or (random() < exp(cost_diff/t)):
             node = child
             node_cost = child_cost
             path.append(node)
+            if node_cost < best_cost:
+                best = node
+                best_cost = node_cost
 
-    return {'outcome': 'success' if problem.goal_test(node) == 0 else 'failure',
-            'solution': path,
-            'problem': problem}
\ No newline at end of file
+    return finish({'outcome': 'success' if problem.goal_test(node) == 0 else 'failure',
+                   'solution': path,
+                   'problem': problem})
+
+
+def score_population(problem, population, pool=None):
+    ''' Returns the cost of every state in population, optionally spreading the work across the processes of pool '''
+    if pool is None:
+        return batch_costs(problem, population)
+    return pool.map(problem.cost_function, population)
+
+
+@consults_cache
+def local_beam_search(problem, beam_width=10, max_iterations=1000, pool=None, budget=None, instrumentation=None):
+
+    rejected = unsolvable_result(problem)
+    if rejected:
+        return rejected
+
+    beam = [problem.start_state]
+    came_from = {problem.start_state: None}
+    best = problem.start_state
+    best_cost = score_population(problem, beam, pool)[0]
+    budget = budget or SearchBudget()
+    timed_out = False
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    expansions = children_generated = evaluations = 0
+    expand_time = evaluate_time = 0
+
+    for _ in range(max_iterations):
+        if problem.goal_test(best):
+            break
+
+        started = clock()
+        children = []
+        for node in beam:
+            for child in node.get_children():
+                children_generated += 1
+                if child not in came_from:
+                    came_from[child] = node
+                    children.append(child)
+        expand_time += clock() - started
+        expansions += len(beam)
+
+        if not children:
+            break
+
+        if budget.spend(len(children)):
+            timed_out = True
+            break
+
+        # Children are shuffled so that ties for the last places in the beam are broken randomly
+        shuffle(children)
+        started = clock()
+        children_cost = score_population(problem, children, pool)
+        evaluate_time += clock() - started
+        evaluations += len(children)
+        ranked = sorted(range(len(children)), key=children_cost.__getitem__)[:beam_width]
+        beam = [children[child_index] for child_index in ranked]
+
+        if children_cost[ranked[0]] > best_cost:
+            break
+        best = beam[0]
+        best_cost = children_cost[ranked[0]]
+
+    path = []
+    while best:
+        path.append(best)
+        best = came_from[best]
+    path.reverse()
+
+    if timed_out:
+        result = timeout_result(problem, path, path[-1], best_cost, budget)
+    else:
+        result = {'outcome': 'success' if problem.goal_test(path[-1]) else 'failure',
+                  'solution': path,
+                  'problem': problem}
+    return report(result, instrumentation,
+                  {'expansions': expansions, 'children': children_generated, 'evaluations': evaluations + 1},
+                  {'expand': expand_time, 'evaluate': evaluate_time})
+
+
+@consults_cache
+def genetic_algorithm(problem, population_size=50, mutation_probability=0.2, max_generations=1000,
+                      initial_mutations=8, pool=None, budget=None, instrumentation=None):
+    ''' States must provide crossover(other), which combines two parents into a single child '''
+
+    population = [problem.start_state]
+    while len(population) < population_size:
+        individual = problem.start_state
+        for _ in range(randrange(1, initial_mutations+1)):
+            individual = individual.random_child()
+        population.append(individual)
+
+    population_cost = score_population(problem, population, pool)
+    best_index = min(range(population_size), key=population_cost.__getitem__)
+    best = population[best_index]
+    best_cost = population_cost[best_index]
+    path = [best]
+    budget = budget or SearchBudget()
+    clock = instrumentation.clock() if instrumentation else zero_clock
+    generations = 0
+    expand_time = evaluate_time = 0
+
+    def finish(result):
+        # Every generation but the first carries over the best individual and breeds the rest
+        return report(result, instrumentation,
+                      {'generations': generations, 'children': generations*(population_size-1),
+                       'evaluations': (generations+1)*population_size},
+                      {'expand': expand_time, 'evaluate': evaluate_time})
+
+    for _ in range(max_generations):
+        if problem.goal_test(best):
+            break
+
+        if budget.spend(population_size):
+            return finish(timeout_result(problem, path, best, best_cost, budget))
+
+        started = clock()
+        weights = [1/(1+cost) for cost in population_cost]
+        next_population = [best]
+        while len(next_population) < population_size:
+            x, y = choices(population, weights, k=2)
+            child = x.crossover(y)
+            if random() < mutation_probability:
+                child = child.random_child()
+            next_population.append(child)
+
+        population = next_population
+        bred = clock()
+        population_cost = score_population(problem, population, pool)
+        expand_time += bred - started
+        evaluate_time += clock() - bred
+        generations += 1
+        best_index = min(range(population_size), key=population_cost.__getitem__)
+        if population[best_index] != best:
+            best = population[best_index]
+            best_cost = population_cost[best_index]
+            path.append(best)
+
+    return finish({'outcome': 'success' if problem.goal_test(best) else 'failure',
+                   'solution': path,
+                   'problem': problem})
+
+
+def solve_many(problems, solver=astar, threads=None, time_limit=None, max_nodes=None, **kwargs):
+    ''' Solves problems with solver in a pool of threads and returns the results in the same order. Each solve gets
+    its own SearchBudget from time_limit and max_nodes. The same kwargs go to every solve, so any object in them is
+    used by all the threads at once: it must be thread-safe, like a SolutionCache, and not per-solve state such as a
+    budget or an Instrumentation, which are not. The solvers keep their state per search and only share read-only
+    tables (e.g. the queens solutions and heuristic tables), so on a free-threaded Python build the solves run in
+    parallel without copying those tables; with the GIL they take turns. '''
+
+    def solve(problem):
+        return solver(problem, budget=SearchBudget(time_limit=time_limit, max_nodes=max_nodes), **kwargs)
+
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(solve, problems))
@@ -0,0 +1,250 @@
+''' Long-running solve service. Clients send newline-delimited JSON requests over TCP or a Unix socket, e.g.
+
+    {"id": 1, "problem": "queens", "queens": [[0, 3], [1, 5], ...], "algorithm": "astar", "time_limit": 1.0}
+    {"id": 2, "problem": "puzzle", "start": [1, 2, ...], "goal": [1, 2, ...], "algorithm": "astar"}
+
+("shape": [rows, cols] is required for non-square puzzles, "side_length" for boards other than 8 x 8; "max_memory"
+caps the bytes a solve may allocate)
+
+and receive one JSON line per request, in completion order, carrying the same id. Requests are grouped into micro-batches
+and solved in a pool of pre-warmed worker processes. Clients must keep the connection open until they have read their
+results. A client may shut down its sending side once it has sent its requests (e.g. nc -N): its replies are still
+written after the end of its input. When the connection fails, its requests are dropped before they are dispatched, and
+batches made up only of abandoned requests are cancelled if they have not started yet. '''
+
+import asyncio
+import json
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+from search import SearchBudget, astar, bidirectional_astar, steepest_ascent_hill_climb, first_choice_hill_climb, \
+    simulated_annealing, local_beam_search, genetic_algorithm, lrta_star
+
+
+SOLVERS = {
+    'astar': astar,
+    'bidirectional_astar': bidirectional_astar,
+    'steepest_ascent_hill_climb': steepest_ascent_hill_climb,
+    'first_choice_hill_climb': first_choice_hill_climb,
+    'simulated_annealing': lambda problem, **kwargs: simulated_annealing(
+        problem, [0.9**(0.05*i-10) for i in range(1, 2000)], **kwargs),
+    'local_beam_search': local_beam_search,
+    'genetic_algorithm': genetic_algorithm,
+    # Learned heuristic values stay in the worker process, so repeated requests towards the same goal improve
+    'lrta_star': lrta_star,
+}
+
+
+def problem_from_json(request):
+    if request['problem'] == 'queens':
+        from queens import QueensProblem, QueensState
+        return QueensProblem(QueensState([tuple(queen) for queen in request['queens']],
+                                         side_length=request.get('side_length', 8)))
+    elif request['problem'] == 'puzzle':
+        from puzzle import PuzzleProblem
+        return PuzzleProblem(start_state=list(request['start']), goal_state=list(request['goal']),
+                             solution_cost=request.get('solution_cost'),
+                             shape=tuple(request['shape']) if 'shape' in request else None)
+    raise ValueError('Unknown problem type: ' + str(request['problem']))
+
+
+def problem_to_json(problem):
+    ''' Returns the request fields that problem_from_json turns back into problem '''
+    if hasattr(problem.start_state, 'queen_positions'):
+        return {'problem': 'queens', 'queens': state_to_json(problem.start_state),
+                'side_length': problem.start_state.side_length}
+    return {'problem': 'puzzle', 'start': state_to_json(problem.start_state), 'goal': state_to_json(problem.goal_state),
+            'solution_cost': problem.solution_cost, 'shape': list(problem.start_state.shape)}
+
+
+def state_to_json(state):
+    if hasattr(state, 'queen_positions'):
+        return sorted([list(queen) for queen in state.queen_positions])
+    return list(state.sequence)
+
+
+def solve_request(request):
+    ''' Solves a single decoded request and returns a JSON-serializable response '''
+    try:
+        problem = problem_from_json(request)
+        solver = SOLVERS[request.get('algorithm', 'astar')]
+        budget = SearchBudget(time_limit=request.get('time_limit'), max_nodes=request.get('max_nodes'),
+                              max_memory=request.get('max_memory'))
+        start_time = timer()
+        result = solver(problem, budget=budget, **request.get('options', {}))
+    except Exception as error:
+        return {'id': request.get('id') if isinstance(request, dict) else None, 'outcome': 'error',
+                'error': repr(error)}
+
+    response = {'id': request.get('id'),
+                'outcome': result['outcome'],
+                'time': (timer()-start_time)*1000,
+                'solution': [state_to_json(state) for state in result.get('solution', [])]}
+    for key in ('total_nodes', 'reason', 'best_cost', 'budget', 'decision_times'):
+        if key in result:
+            response[key] = result[key]
+    if 'best_state' in result:
+        response['best_state'] = state_to_json(result['best_state'])
+    return response
+
+
+def solve_batch(requests):
+    return [solve_request(request) for request in requests]
+
+
+def warm_worker():
+    # Builds the tables the solves share (e.g. the 92 queens solutions) once per worker, before the first request
+    from queens import all_queen_states
+    import puzzle
+    all_queen_states(8)
+
+
+class SolveServer:
+
+    def __init__(self, workers=4, batch_size=16, batch_window=0.002):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.pool = None
+        self.queue = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        # Worker processes are started on demand, so one task per worker forces them all to start up front
+        await asyncio.gather(*[loop.run_in_executor(self.pool, warm_worker) for _ in range(self.workers)])
+        self.queue = asyncio.Queue()
+        # Batches are only formed when a worker is free, so queued requests stay cancellable for as long as possible
+        self.free_workers = asyncio.Semaphore(self.workers)
+        self.batcher = asyncio.ensure_future(self.dispatch_batches())
+
+    async def stop(self):
+        self.batcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def dispatch_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.free_workers.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [(request, future) for request, future in batch if not future.cancelled()]
+            if not batch:
+                self.free_workers.release()
+            else:
+                work = self.pool.submit(solve_batch, [request for request, _ in batch])
+                # The worker is free once the pool is done with the batch. Cancelling the asyncio future below does not
+                # stop a batch that is already running, so the release hangs off the pool's own future.
+                work.add_done_callback(lambda _: self.release_worker(loop))
+                execution = asyncio.wrap_future(work)
+                execution.add_done_callback(lambda execution, batch=batch: self.deliver(execution, batch))
+                for _, future in batch:
+                    future.add_done_callback(lambda _, execution=execution, batch=batch:
+                                             self.cancel_if_abandoned(execution, batch))
+
+    def release_worker(self, loop):
+        # Called from the pool's thread
+        try:
+            loop.call_soon_threadsafe(self.free_workers.release)
+        except RuntimeError:
+            pass    # the event loop has already closed with the server
+
+    @staticmethod
+    def deliver(execution, batch):
+        if execution.cancelled():
+            return
+        error = execution.exception()
+        for index, (request, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_result({'id': request.get('id') if isinstance(request, dict) else None, 'outcome': 'error',
+                                   'error': repr(error)})
+            else:
+                future.set_result(execution.result()[index])
+
+    @staticmethod
+    def cancel_if_abandoned(execution, batch):
+        if all(future.cancelled() for _, future in batch):
+            execution.cancel()
+
+    async def solve(self, request):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def handle_client(self, reader, writer):
+
+        pending = set()
+
+        async def respond(request):
+            response = await self.solve(request)
+            writer.write((json.dumps(response) + '\n').encode())
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    writer.write((json.dumps({'outcome': 'error', 'error': repr(error)}) + '\n').encode())
+                    continue
+                if not isinstance(request, dict):
+                    writer.write((json.dumps({'outcome': 'error', 'error': 'a request must be a JSON object'}) +
+                                  '\n').encode())
+                    continue
+                task = asyncio.ensure_future(respond(request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            # End of input: a client that only shut down its sending side is still waiting for its replies
+            if pending:
+                await asyncio.wait(pending)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, unix_path=None, **kwargs):
+    solve_server = SolveServer(**kwargs)
+    await solve_server.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(solve_server.handle_client, path=unix_path)
+    else:
+        server = await asyncio.start_server(solve_server.handle_client, host, port)
+    print('Serving on ' + ', '.join(str(sock.getsockname()) for sock in server.sockets), flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await solve_server.stop()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve queens and puzzle solver calls over a local socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', dest='unix_path', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--batch-window', type=float, default=2, help='milliseconds to wait to fill a batch')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix_path, workers=args.workers, batch_size=args.batch_size,
+                          batch_window=args.batch_window / 1000))
+    except KeyboardInterrupt:
+        pass
@@ -1,151 +1,648 @@
-from statistics import mean, stdev
+import json
+import os
+import tracemalloc
+from argparse import ArgumentParser
+from functools import partial
+from multiprocessing import Pool
+from random import seed as set_seed
+from statistics import mean
 from timeit import default_timer as timer
 from search import steepest_ascent_hill_climb, first_choice_hill_climb, random_restart_hill_climb, \
-    simulated_annealing, astar
+    simulated_annealing, astar, bidirectional_astar, local_beam_search, genetic_algorithm, lrta_star, \
+    lrta_star_trials, Instrumentation, SearchBudget
+from stream_stats import ResultAggregator, RunningStats
 
 
-def mean_sd_for_dict_key(result_list, key):
-    results = [result[key] for result in result_list]
+def aggregate(results, algorithm=None):
+    ''' Returns a ResultAggregator holding results, summarized in one pass '''
+    aggregator = ResultAggregator()
+    for result in results:
+        aggregator.add(result, algorithm)
+    return aggregator
 
-    if len(result_list) == 1:
-        return {'mean': result_list[0][key], 'sd': 0}
-    elif not result_list:
-        return {'mean': 0, 'sd': 0}
 
-    return {'mean': mean(results), 'sd': stdev(results)}
-
-
-def print_summary_table(results):
+def print_summary_table(aggregator, algorithm=None):
 
     title_col_width = 30
     data_col_width = 15
 
-    def print_data_row(row_title, data_string, data_func, results):
+    columns = [{}, {'success': True}, {'success': False}]
+    column_stats = [aggregator.select(algorithm=algorithm, **column) for column in columns]
+    column_counts = [aggregator.count(algorithm=algorithm, **column) for column in columns]
+
+    def print_data_row(row_title, data_string, field):
         nonlocal title_col_width, data_col_width
         row = (row_title + '\t').rjust(title_col_width)
-        for result_group in results:
-            row += data_string.format(**data_func(result_group)).ljust(data_col_width)
+        for stats in column_stats:
+            summary = stats[field].summary() if field in stats else RunningStats().summary()
+            # Wide cells (e.g. long phase times) still get a space before the next column
+            row += data_string.format(**summary).ljust(data_col_width-1) + ' '
         print(row)
 
-    num_iterations = len(results[0])
+    num_iterations = column_counts[0]
+    fields = column_stats[0]
 
     print('\t'.rjust(title_col_width) +
           'All Problems'.ljust(data_col_width) +
           'Successes'.ljust(data_col_width) +
           'Failures'.ljust(data_col_width))
 
-    print_data_row('Number of Problems:',
-                   '{count:.0f} ({percent:.1%})',
-                   lambda x: {'count': len(x), 'percent': len(x) / num_iterations},
-                   results)
+    print(('Number of Problems:' + '\t').rjust(title_col_width) +
+          ''.join('{count:.0f} ({percent:.1%})'.format(count=count, percent=count / num_iterations)
+                  .ljust(data_col_width) for count in column_counts))
 
-    print_data_row('Mean time to completion:',
-                   '{mean:.0f} ± {sd:.0f} ms',
-                   lambda x: mean_sd_for_dict_key(x, 'time'),
-                   results)
+    print_data_row('Mean time to completion:', '{mean:.0f} ± {sd:.0f} ms', 'time')
+    print_data_row('Time p50 / p90:', '{p50:.0f} / {p90:.0f} ms', 'time')
+    print_data_row('Time p99 / max:', '{p99:.0f} / {max:.0f} ms', 'time')
 
-    print_data_row('Mean path length:',
-                   '{mean:.0f} ± {sd:.0f}',
-                   lambda x: mean_sd_for_dict_key(x, 'path_length'),
-                   results)
+    print_data_row('Mean path length:', '{mean:.0f} ± {sd:.0f}', 'path_length')
 
-    if 'total_nodes' in results[0][0].keys():
-        print_data_row('Mean nodes generated:',
-                       '{mean:.0f} ± {sd:.0f}',
-                       lambda x: mean_sd_for_dict_key(x, 'total_nodes'),
-                       results)
+    if 'total_nodes' in fields:
+        print_data_row('Mean nodes generated:', '{mean:.0f} ± {sd:.0f}', 'total_nodes')
+        print_data_row('Nodes p50 / p90:', '{p50:.0f} / {p90:.0f}', 'total_nodes')
+        print_data_row('Nodes p99 / max:', '{p99:.0f} / {max:.0f}', 'total_nodes')
 
+    if 'peak_memory' in fields:
+        print_data_row('Mean peak memory:', '{mean:.0f} ± {sd:.0f} KiB', 'peak_memory')
+        print_data_row('Max peak memory:', '{max:.0f} KiB', 'peak_memory')
 
-def print_optimal_cost_table(results):
+    if 'bound' in fields:
+        print_data_row('Mean achieved bound:', '{mean:.3f} ± {sd:.3f}', 'bound')
 
-    sorted_by_optimal_cost = {}
-    for result in results[0]:
-        if result['optimal_cost'] not in sorted_by_optimal_cost.keys():
-            sorted_by_optimal_cost[result['optimal_cost']] = []
-        sorted_by_optimal_cost[result['optimal_cost']].append(result)
+    # Instrumentation counters and phase times (see search.Instrumentation)
+    for field in sorted(fields):
+        if field.startswith('stats.'):
+            name = field[len('stats.'):]
+            print_data_row('Mean ' + (name[:-3] + ' time' if name.endswith('_ms') else name).replace('_', ' ') + ':',
+                           '{mean:.1f} ± {sd:.1f} ms' if name.endswith('_ms') else '{mean:.0f} ± {sd:.0f}', field)
+
+
+def print_optimal_cost_table(aggregator, algorithm=None):
+
+    show_nodes = 'total_nodes' in aggregator.select(algorithm=algorithm)
+    show_memory = 'peak_memory' in aggregator.select(algorithm=algorithm)
 
     print('\n')
     print('Path length and success by optimal solution length')
     print('Optimal Cost'.rjust(15) + '    ' +
           'n'.ljust(6) +
           'Path Length'.ljust(15) +
-          'Success'.ljust(10))
-
-    optimal_costs = sorted(sorted_by_optimal_cost.keys())
-    for optimal_cost in optimal_costs:
-        group = sorted_by_optimal_cost[optimal_cost]
-        if group:
-            path_length_mean_sd = '{mean:.1f} ± {sd:.1f}'.format(**mean_sd_for_dict_key(group, 'path_length'))
-            percent_success = len([result for result in group if result['outcome'] == 'success']) / len(group) * 100
-            print('{optimal_cost:>15}    {count:<6}{path_length:<15}{success:<10.1f}'.
-                  format(optimal_cost=optimal_cost, path_length=path_length_mean_sd, success=percent_success,
-                         count=len(group)))
+          'Success'.ljust(10) +
+          'Time p50 / p99'.ljust(20) +
+          ('Nodes Generated'.ljust(20) + 'Nodes p50 / p99'.ljust(20) if show_nodes else '') +
+          ('Peak KiB (max)'.ljust(20) if show_memory else ''))
+
+    for optimal_cost in aggregator.optimal_costs(algorithm):
+        count = aggregator.count(algorithm=algorithm, optimal_cost=optimal_cost)
+        stats = aggregator.select(algorithm=algorithm, optimal_cost=optimal_cost)
+        percent_success = aggregator.count(algorithm=algorithm, optimal_cost=optimal_cost, success=True) / count * 100
+        path_length_mean_sd = '{mean:.1f} ± {sd:.1f}'.format(**stats['path_length'].summary())
+        time_percentiles = '{p50:.1f} / {p99:.1f} ms'.format(**stats['time'].summary())
+        nodes = '{mean:.0f} ± {sd:.0f}'.format(**stats['total_nodes'].summary()).ljust(20) + \
+            '{p50:.0f} / {p99:.0f}'.format(**stats['total_nodes'].summary()).ljust(20) if show_nodes else ''
+        memory = '{mean:.0f} ({max:.0f})'.format(**stats['peak_memory'].summary()) if show_memory else ''
+        print(('{optimal_cost:>15}    {count:<6}{path_length:<15}{success:<10.1f}{time:<20}'.
+               format(optimal_cost=optimal_cost, path_length=path_length_mean_sd, success=percent_success,
+                      count=count, time=time_percentiles) + nodes + memory).rstrip())
 
 
 def print_results(results):
-    print_summary_table(results)
-    print_optimal_cost_table(results)
+    aggregator = aggregate(results[0])
+    print_summary_table(aggregator)
+    print_optimal_cost_table(aggregator)
+
+
+def print_tradeoff_table(baseline_results, results):
+    ''' Compares nodes generated and path length against a baseline run over the same problems, by optimal cost. Only
+    problems that both runs solved are compared; the others are counted below the table. '''
+
+    sorted_by_optimal_cost = {}
+    skipped = 0
+    for baseline, result in zip(baseline_results, results):
+        if baseline['outcome'] != 'success' or result['outcome'] != 'success':
+            skipped += 1
+            continue
+        sorted_by_optimal_cost.setdefault(result['optimal_cost'], []).append((baseline, result))
 
+    print('\n')
+    print('Node savings and path length loss against the baseline by optimal solution length')
+    print('Optimal Cost'.rjust(15) + '    ' +
+          'n'.ljust(6) +
+          'Node Savings'.ljust(15) +
+          'Extra Length'.ljust(15) +
+          'Max Bound'.ljust(10))
 
-def analyze_performance(problem_set, search_function):
+    for optimal_cost in sorted(sorted_by_optimal_cost.keys()):
+        group = sorted_by_optimal_cost[optimal_cost]
+        # Cached solutions report no nodes and no bound
+        baseline_nodes = sum(baseline.get('total_nodes', 0) for baseline, _ in group)
+        nodes = sum(result.get('total_nodes', 0) for _, result in group)
+        extra_length = mean([result['path_length'] - baseline['path_length'] for baseline, result in group])
+        bounds = [result['bound'] for _, result in group if result.get('bound') is not None]
+        savings = format(1 - nodes / baseline_nodes, '.1%') if baseline_nodes else '-'
+        bound = format(max(bounds), '.3f') if bounds else '-'
+        print('{optimal_cost:>15}    {count:<6}{savings:<15}{extra_length:<15.2f}{bound:<10}'.
+              format(optimal_cost=optimal_cost, count=len(group), savings=savings, extra_length=extra_length,
+                     bound=bound))
+
+    if skipped:
+        print(str(skipped) + ' problem(s) not solved by both runs left out')
+
+
+def analyze_performance(problem_set, search_function, instrument=False, memory=False, max_memory=None):
+    ''' With instrument, search_function is called with instrumentation=Instrumentation() and the summary table shows
+    the solver's counters and phase times. With memory, allocations are traced with tracemalloc and the peak of each
+    solve is reported, which slows the solves down. With max_memory (bytes), search_function is also given a
+    SearchBudget that stops a solve with outcome 'timeout' and reason 'memory' once it has allocated that much. '''
 
     num_iterations = len(problem_set)
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
 
     results = []
     for problem_num, problem in enumerate(problem_set):
         print('\rSolving problem ' + str(problem_num+1) + ' of ' + str(num_iterations), end='', flush=True)
+        options = {'instrumentation': Instrumentation()} if instrument else {}
+        if memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        if max_memory is not None:
+            options['budget'] = SearchBudget(max_memory=max_memory)
         start_time = timer()
-        result = search_function(problem)
+        result = search_function(problem, **options)
         result['time'] = (timer()-start_time)*1000
+        if memory:
+            result['peak_memory'] = (tracemalloc.get_traced_memory()[1] - memory_before) / 1024
         result['optimal_cost'] = problem.optimal_solution_cost()
         result['path_length'] = len(result['solution'])-1
         results.append(result)
 
+    if tracing:
+        tracemalloc.stop()
     print(' '*50 + '\r', end='', flush=True)
 
     results = [results,
                [result for result in results if result['outcome'] == 'success'],
-               [result for result in results if result['outcome'] == 'failure']]
+               [result for result in results if result['outcome'] != 'success']]
 
     print_results(results)
 
+    return results[0]
 
-def analyze_all_algorithms(problem_set):
+
+def compare_throughput(problem_generator, search_functions, seconds=10):
+    ''' Runs each search function on fresh problems for the same wall-clock time and reports problems solved '''
+
+    print('Algorithm'.rjust(30) + '    ' +
+          'Attempted'.ljust(12) +
+          'Solved'.ljust(12) +
+          'Solved per second'.ljust(20))
+
+    for name, search_function in search_functions:
+        attempted = 0
+        solved = 0
+        start_time = timer()
+        while timer() - start_time < seconds:
+            result = search_function(problem_generator())
+            attempted += 1
+            solved += result['outcome'] == 'success'
+        elapsed = timer() - start_time
+        print('{name:>30}    {attempted:<12}{solved:<12}{rate:<20.1f}'.
+              format(name=name, attempted=attempted, solved=solved, rate=solved / elapsed))
+
+
+def analyze_all_algorithms(problem_set, instrument=False, memory=False):
 
     section_break = '\n' + '_'*100 + '\n'
 
     print(section_break)
     print('Results from steepest ascent hill climb (no sideways moves allowed):\n')
-    analyze_performance(problem_set, steepest_ascent_hill_climb)
+    analyze_performance(problem_set, steepest_ascent_hill_climb, instrument, memory)
     print(section_break)
 
     print('Results from steepest ascent hill climb (up to 100 consecutive sideways moves allowed):\n')
-    analyze_performance(problem_set, lambda x: steepest_ascent_hill_climb(x, allow_sideways=True))
+    analyze_performance(problem_set, lambda x, **options: steepest_ascent_hill_climb(x, allow_sideways=True, **options),
+                        instrument, memory)
     print(section_break)
 
     print('Results from first choice hill climb (no sideways moves allowed):\n')
-    analyze_performance(problem_set, first_choice_hill_climb)
+    analyze_performance(problem_set, first_choice_hill_climb, instrument, memory)
     print(section_break)
 
     print('Result from random restart hill climb:\n')
-    analyze_performance(problem_set, lambda x: random_restart_hill_climb(problem_set[0].__class__))
+    analyze_performance(problem_set, lambda x, **options: random_restart_hill_climb(problem_set[0].__class__,
+                                                                                    **options), instrument, memory)
     print(section_break)
 
     print('Result from simulated annealing:\n')
-    analyze_performance(problem_set, lambda x: simulated_annealing(x, [0.9**(0.05*i-10) for i in range(1, 2000)]))
+    analyze_performance(problem_set, lambda x, **options: simulated_annealing(
+        x, [0.9**(0.05*i-10) for i in range(1, 2000)], **options), instrument, memory)
     print(section_break)
 
     print('Results from A*:')
-    analyze_performance(problem_set, astar)
+    analyze_performance(problem_set, astar, instrument, memory)
+    print(section_break)
+
+    print('Results from local beam search (k=10):\n')
+    analyze_performance(problem_set, local_beam_search, instrument, memory)
+    print(section_break)
+
+    if hasattr(problem_set[0].start_state, 'crossover'):
+        print('Results from genetic algorithm (population of 50):\n')
+        analyze_performance(problem_set, genetic_algorithm, instrument, memory)
+        print(section_break)
+
+
+def analyze_puzzle_heuristics(problem_set):
+    from puzzle import PuzzleProblem, h_manhattan, h_linear_conflict, h_walking_distance
+
+    section_break = '\n' + '_'*100 + '\n'
+
+    for heuristic, description in [(h_manhattan, 'Manhattan distance'),
+                                   (h_linear_conflict, 'Manhattan distance plus linear conflicts'),
+                                   (h_walking_distance, 'walking distance')]:
+        print('Results from A* with the ' + description + ' heuristic:')
+        analyze_performance([PuzzleProblem(cost_function=heuristic, start_state=problem.start_state.sequence,
+                                           goal_state=problem.goal_state.sequence,
+                                           solution_cost=problem.solution_cost) for problem in problem_set], astar)
+        print(section_break)
+
+
+def analyze_queens_heuristics(problem_set, astar_problems=20):
+    ''' Compares the number of attacking pairs with the number of groups of attacking queens as the heuristic of
+    steepest ascent hill climb with sideways moves, and of A* on the first astar_problems problems (with the admissible
+    groups heuristic, A* finds optimal solutions but generates far more nodes) '''
+    from queens import QueensProblem, h_num_attacks, h_distinct_attacks
+
+    section_break = '\n' + '_'*100 + '\n'
+
+    for heuristic, description in [(h_num_attacks, 'attacking pairs'),
+                                   (h_distinct_attacks, 'groups of attacking queens')]:
+        problems = [QueensProblem(problem.start_state, cost_function=heuristic) for problem in problem_set]
+        print('Results from steepest ascent hill climb (sideways moves allowed) with the ' + description +
+              ' heuristic:\n')
+        analyze_performance(problems, lambda x, **options: steepest_ascent_hill_climb(x, allow_sideways=True,
+                                                                                      **options), instrument=True)
+        print(section_break)
+        print('Results from A* with the ' + description + ' heuristic:')
+        analyze_performance(problems[:astar_problems], astar, instrument=True)
+        print(section_break)
+
+
+def analyze_suboptimal_astar(problem_set, weight=1.5):
+
+    section_break = '\n' + '_'*100 + '\n'
+
+    print('Results from A* (baseline for the bounded-suboptimal modes):')
+    baseline_results = analyze_performance(problem_set, astar)
     print(section_break)
 
+    for mode, description in [('weighted', 'weighted A*'), ('dynamic', 'dynamically weighted A*'),
+                              ('focal', 'A*epsilon (focal search)')]:
+        print('Results from ' + description + ' with w=' + str(weight) + ':')
+        results = analyze_performance(problem_set, lambda x: astar(x, weight=weight, mode=mode))
+        print_tradeoff_table(baseline_results, results)
+        print(section_break)
+
+    return baseline_results
 
-print('ANALYZING ALGORITHM PERFORMANCE FOR 8-QUEENS PROBLEMS:')
-from queens import QueensProblem
-queens_problem_set = [QueensProblem() for _ in range(1000)]
-analyze_all_algorithms(queens_problem_set)
 
-print('\n\nANALYZING ALGORITHM PERFORMANCE FOR 8-PUZZLE PROBLEMS:')
-from puzzle import PuzzleProblem
-puzzle_problem_set = [PuzzleProblem() for _ in range(2400)]
-analyze_all_algorithms(puzzle_problem_set)
\ No newline at end of file
+def analyze_bidirectional_astar(problem_set, baseline_results=None):
+    ''' Compares the nodes bidirectional A* generates with A*'s, by optimal solution length. baseline_results are A*
+    results for the same problems, e.g. from analyze_suboptimal_astar; they are computed if not given. '''
+
+    section_break = '\n' + '_'*100 + '\n'
+
+    if baseline_results is None:
+        print('Results from A* (baseline for bidirectional A*):')
+        baseline_results = analyze_performance(problem_set, astar)
+        print(section_break)
+
+    print('Results from bidirectional A*:')
+    results = analyze_performance(problem_set, bidirectional_astar)
+    print_tradeoff_table(baseline_results, results)
+    print(section_break)
+
+
+def analyze_real_time_search(problem_set, lookaheads=(1, 8, 64), trials=50):
+    ''' Reports, for each lookahead, the per-decision latency of lrta_star, the path length of a first trial with
+    nothing learned, and how many repeated trials on the same problem it takes until a trial learns nothing new '''
+
+    print('Lookahead'.rjust(15) + '    ' +
+          'First Length'.ljust(15) +
+          'Decision p50 / p99 / max'.ljust(30) +
+          'Trials to Converge'.ljust(20) +
+          'Converged'.ljust(10))
+
+    for lookahead in lookaheads:
+        decision_times = RunningStats()
+        first_lengths = RunningStats()
+        trials_to_converge = RunningStats()
+        for problem_num, problem in enumerate(problem_set):
+            print('\rSolving problem ' + str(problem_num+1) + ' of ' + str(len(problem_set)), end='', flush=True)
+            run = lrta_star_trials(problem, trials, lookahead=lookahead)
+            for result in run['trials']:
+                for decision_time in result['decision_times']:
+                    decision_times.add(decision_time)
+            first_lengths.add(len(run['trials'][0]['solution'])-1)
+            if run['converged_after'] is not None:
+                trials_to_converge.add(run['converged_after'] + 1)
+        print(' '*50 + '\r', end='', flush=True)
+        print('{lookahead:>15}    {first:<15}{decisions:<30}{trials:<20}{converged:<10.1%}'.format(
+            lookahead=lookahead, first='{mean:.1f} ± {sd:.1f}'.format(**first_lengths.summary()),
+            decisions='{p50:.3f} / {p99:.3f} / {max:.3f} ms'.format(**decision_times.summary()),
+            trials='{mean:.1f} ({max:.0f})'.format(**trials_to_converge.summary()),
+            converged=trials_to_converge.count / len(problem_set)))
+
+
+def run_full_analysis():
+    ''' Runs the analysis whose output is shown in README.txt '''
+
+    from queens import QueensProblem, all_8queen_states
+    all_8queen_states()
+    print('ANALYZING ALGORITHM PERFORMANCE FOR 8-QUEENS PROBLEMS:')
+    from problemsets import QueensSet
+    queens_problem_set = list(QueensSet.random(1000))
+    analyze_all_algorithms(queens_problem_set, instrument=True)
+    analyze_queens_heuristics(queens_problem_set[:100])
+
+    print('Throughput of population-based search against random restart hill climb (10 s each):\n')
+    compare_throughput(QueensProblem, [('random restart hill climb',
+                                        lambda x: random_restart_hill_climb(QueensProblem)),
+                                       ('local beam search (k=10)', local_beam_search),
+                                       ('genetic algorithm', genetic_algorithm)])
+
+    print('\n\nANALYZING ALGORITHM PERFORMANCE FOR 8-PUZZLE PROBLEMS:')
+    from puzzle import PuzzleProblem
+    puzzle_problem_set = [PuzzleProblem() for _ in range(2400)]
+    analyze_all_algorithms(puzzle_problem_set, instrument=True)
+    baseline_results = analyze_suboptimal_astar(puzzle_problem_set)
+    analyze_bidirectional_astar(puzzle_problem_set, baseline_results)
+    analyze_puzzle_heuristics(puzzle_problem_set)
+    print('Real-time search (LRTA*/RTAA*) by lookahead, repeating each problem until nothing new is learned:\n')
+    analyze_real_time_search(puzzle_problem_set[:100])
+
+
+def restart_generator(problem, make_problem):
+    ''' Returns a problem generator for random_restart_hill_climb that yields problem first and then make_problem() '''
+    first = [problem]
+    return lambda: first.pop() if first else make_problem()
+
+
+def random_problem_factory(problem):
+    ''' Returns a function making fresh random problems of the same kind and size as problem '''
+    if hasattr(problem.start_state, 'queen_positions'):
+        from queens import QueensProblem, QueensState
+        side_length = problem.start_state.side_length
+        return lambda: QueensProblem(QueensState(queen_num=side_length, side_length=side_length))
+
+    from puzzle import PuzzleProblem, random_solvable_sequence
+    goal = problem.goal_state
+    return lambda: PuzzleProblem(problem.heuristic_function, random_solvable_sequence(list(goal.sequence), goal.width),
+                                 list(goal.sequence), shape=goal.shape)
+
+
+# Solvers the sweep runner can select by name. Each takes a problem and keyword options.
+ALGORITHMS = {
+    'steepest_ascent_hill_climb': steepest_ascent_hill_climb,
+    'steepest_ascent_hill_climb_sideways': partial(steepest_ascent_hill_climb, allow_sideways=True),
+    'first_choice_hill_climb': first_choice_hill_climb,
+    'random_restart_hill_climb': lambda problem, **options: random_restart_hill_climb(
+        restart_generator(problem, random_problem_factory(problem)), **options),
+    'simulated_annealing': partial(simulated_annealing,
+                                   temperature_schedule=[0.9**(0.05*i-10) for i in range(1, 2000)]),
+    'astar': astar,
+    'bidirectional_astar': bidirectional_astar,
+    # Each solve starts with nothing learned, so results do not depend on which problems a worker solved before
+    'lrta_star': lambda problem, **options: lrta_star(problem, **dict({'learned': {}}, **options)),
+    'local_beam_search': local_beam_search,
+    'genetic_algorithm': genetic_algorithm,
+}
+
+# Algorithms a sweep runs by default on each problem type: the genetic algorithm needs crossover, which puzzle states
+# do not have, and bidirectional search needs a goal state, which queens problems do not have
+DEFAULT_ALGORITHMS = {'queens': sorted(set(ALGORITHMS) - {'bidirectional_astar'}),
+                      'puzzle': sorted(set(ALGORITHMS) - {'genetic_algorithm'})}
+
+
+def problem_key(problem):
+    ''' Returns a string that identifies problem exactly, used to match checkpointed results to problems '''
+    if hasattr(problem.start_state, 'queen_positions'):
+        return 'queens:' + str(problem.start_state.side_length) + ':' + str(sorted(problem.start_state.queen_positions))
+    return 'puzzle:' + str(problem.goal_state.height) + 'x' + str(problem.goal_state.width) + ':' + \
+        ','.join(map(str, problem.start_state.sequence)) + '>' + ','.join(map(str, problem.goal_state.sequence))
+
+
+def make_problem_set(problem_type, size, count, seed, walk_length=40):
+    ''' Returns a columnar set (see problemsets.py) of count problems drawn from seed. Queens problems are random
+    boards of size x size. 3 x 3 puzzles are taken from the depth samples, and other sizes from the samples stored by
+    external_bfs.py, so their optimal cost is known. Without a sample file, puzzles are random walks of walk_length
+    moves away from the goal, with unknown optimal cost: sweeps run unattended, so the samples are never generated
+    here (see puzzle.export_random_depth_sample and external_bfs.py). '''
+    from numpy.random import default_rng
+    from problemsets import PuzzleSet, QueensSet
+    if problem_type == 'queens':
+        return QueensSet.random(count, size, seed)
+
+    from external_bfs import default_directory
+    sample_file = default_directory((size, size)) + '.pickle'
+    if size == 3 and os.path.exists(sample_file):
+        from puzzle import load_depth_file
+        # The samples are taken in file order, not shuffled, so that the same seed always picks the same problems
+        samples = PuzzleSet.from_samples([dict(sample, depth=(depth + 1) * 2)
+                                          for depth, depth_sample in enumerate(load_depth_file(sample_file))
+                                          for sample in depth_sample])
+        return samples.take(default_rng(seed).choice(len(samples), min(count, len(samples)), replace=False))
+
+    if os.path.isdir(default_directory((size, size))):
+        samples = PuzzleSet.load(default_directory((size, size)))
+        return samples.take(default_rng(seed).choice(len(samples), min(count, len(samples)), replace=False))
+
+    print('No puzzle samples found in ' + (sample_file if size == 3 else default_directory((size, size))) +
+          '; using random walks of ' + str(walk_length) + ' moves, whose optimal cost is unknown.')
+    return PuzzleSet.random_walks(count, (size, size), walk_length, seed)
+
+
+def solve_task(task):
+    ''' Solves one (algorithm, options, problem, seed, instrument) task and returns a JSON-serializable record of the
+    result. Runs in the worker processes of run_sweep. A solver that raises is recorded with outcome 'error' and the
+    exception, so the rest of the sweep goes on. '''
+    algorithm, options, problem, seed, instrument = task
+    set_seed(seed)
+    if instrument:
+        options = dict(options, instrumentation=Instrumentation())
+    start_time = timer()
+    try:
+        result = ALGORITHMS[algorithm](problem, **options)
+    except Exception as error:
+        return {'outcome': 'error', 'error': repr(error), 'time': (timer()-start_time)*1000,
+                'optimal_cost': problem.optimal_solution_cost()}
+    record = {'outcome': result['outcome'],
+              'time': (timer()-start_time)*1000,
+              'path_length': len(result['solution'])-1,
+              'optimal_cost': problem.optimal_solution_cost()}
+    for key in ('total_nodes', 'bound', 'reason', 'stats'):
+        if key in result:
+            record[key] = result[key]
+    return record
+
+
+def load_checkpoint(filename):
+    ''' Returns the records in a JSON-lines results file. A partly written last line, left by an interrupted run, is
+    cut off so that new records can be appended after it. '''
+    records = []
+    try:
+        with open(filename, 'r+') as file:
+            end = 0
+            for line in iter(file.readline, ''):
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                end = file.tell()
+            file.truncate(end)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def run_sweep(problem_type, size, count, algorithms, seed=0, workers=1, output='results.jsonl', options=None,
+              instrument=False, serve=None, authkey=None, lease_time=60, local_workers=0):
+    ''' Runs every algorithm on the same problem set and appends one JSON line per (problem, solver configuration) to
+    output as results come in. Results already in output for the same problem and configuration are reused, so an
+    interrupted sweep picks up where it stopped. Returns the records for each algorithm.
+    With serve ('host:port'), the solves are handed out to distributed workers (see distributed.py) instead, and
+    local_workers worker processes are started on this machine to join them. authkey may only be left out when serve
+    is a loopback address. '''
+    options = options or {}
+    problem_set = make_problem_set(problem_type, size, count, seed)
+    problems = list(problem_set)
+    keys = [problem_key(problem) for problem in problems]
+    # Instrumentation does not change the result, so it is not part of the solver configuration
+    configs = {algorithm: algorithm + json.dumps(options, sort_keys=True) for algorithm in algorithms}
+
+    # Solves that raised are tried again, in case the cause has been fixed since
+    done = {(record['problem'], record['config']): record for record in load_checkpoint(output)
+            if record['outcome'] != 'error'}
+    tasks = []
+    scheduled = set()
+    for algorithm in algorithms:
+        for index, key in enumerate(keys):
+            # A problem drawn twice is solved once
+            if (key, configs[algorithm]) not in done and (key, configs[algorithm]) not in scheduled:
+                scheduled.add((key, configs[algorithm]))
+                tasks.append(((algorithm, options, index, str(seed) + ':' + str(index), instrument),
+                              (key, configs[algorithm])))
+    print(str(len(done)) + ' results loaded from ' + output + ', ' + str(len(tasks)) + ' solves to go.')
+
+    ids = [ids for _, ids in tasks]
+    tasks = [task for task, _ in tasks]
+
+    def save_results(solved):
+        with open(output, 'a') as file:
+            for completed, (index, record) in enumerate(solved):
+                print('\rSolved ' + str(completed+1) + ' of ' + str(len(tasks)), end='', flush=True)
+                key, config = ids[index]
+                record.update(problem=key, config=config)
+                done[(key, config)] = record
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+
+    if serve:
+        # Problems travel as the server's JSON requests, which any host can rebuild
+        from distributed import coordinate
+        from server import problem_to_json
+        solved = coordinate([(algorithm, options, problem_to_json(problems[index]), task_seed, instrument)
+                             for algorithm, options, index, task_seed, instrument in tasks],
+                            serve, authkey, lease_time=lease_time, local_workers=local_workers,
+                            solve=solve_remote_task, processes=workers)
+        try:
+            save_results(solved)
+        finally:
+            # Stops the workers and the task server even if recording a result failed
+            solved.close()
+    elif workers > 1:
+        # Workers read their problems from the set in shared memory instead of receiving them pickled. Leaving the
+        # with blocks stops the pool and frees the shared memory, whether or not the sweep finished.
+        with problem_set.shared() as handle, Pool(workers) as pool:
+            save_results(enumerate(pool.imap(solve_shared_task, [(handle,) + task for task in tasks])))
+    else:
+        save_results((task_index, solve_task((algorithm, options, problems[index], task_seed, instrument)))
+                     for task_index, (algorithm, options, index, task_seed, instrument) in enumerate(tasks))
+    print()
+
+    # Solves that were given up on (see distributed.coordinate) are left out
+    return {algorithm: [done[(key, configs[algorithm])] for key in keys if (key, configs[algorithm]) in done]
+            for algorithm in algorithms}
+
+
+def solve_shared_task(task):
+    ''' Solves a task that refers to its problem by index into a set shared with problemsets.SharedSet '''
+    handle, algorithm, options, index, seed, instrument = task
+    return solve_task((algorithm, options, handle.attach()[index], seed, instrument))
+
+
+def solve_remote_task(task):
+    ''' Solves a task whose problem was serialized with server.problem_to_json, for distributed workers '''
+    from server import problem_from_json
+    algorithm, options, problem, seed, instrument = task
+    return solve_task((algorithm, options, problem_from_json(problem), seed, instrument))
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Analyze the search algorithms. Without a command, runs the full analysis '
+                                        'shown in README.txt.')
+    commands = parser.add_subparsers(dest='command')
+    sweep = commands.add_parser('sweep', help='run selected algorithms on a problem set, resumably')
+    sweep.add_argument('--problem', choices=['queens', 'puzzle'], default='queens')
+    sweep.add_argument('--size', type=int, default=None, help='board side length (default 8 for queens, 3 for puzzles)')
+    sweep.add_argument('--count', type=int, default=1000, help='number of problems')
+    sweep.add_argument('--algorithms', nargs='+', choices=sorted(ALGORITHMS),
+                       help='default: every algorithm that applies to the problem type')
+    sweep.add_argument('--options', type=json.loads, default={},
+                       help='JSON object of keyword options passed to every algorithm, e.g. \'{"weight": 1.5}\'')
+    sweep.add_argument('--seed', type=int, default=0, help='seed for the problem set and the solvers')
+    sweep.add_argument('--workers', type=int, default=1, help='solver processes (per local worker with --serve)')
+    sweep.add_argument('--output', default='results.jsonl', help='JSON-lines results file, resumed if it exists')
+    sweep.add_argument('--instrument', action='store_true', help='collect solver counters and phase times')
+    sweep.add_argument('--serve', metavar='HOST:PORT', help='hand the solves out to workers connecting to this address')
+    sweep.add_argument('--local-workers', type=int, default=0, help='workers to start on this machine with --serve')
+    sweep.add_argument('--lease-time', type=float, default=60,
+                       help='seconds without word from a worker before its batch is given to another')
+    worker = commands.add_parser('worker', help='solve batches for a sweep started with --serve')
+    worker.add_argument('--connect', metavar='HOST:PORT', required=True)
+    worker.add_argument('--workers', type=int, default=1, help='solver processes')
+    for command in (sweep, worker):
+        command.add_argument('--authkey', help='shared secret of the coordinator and its workers; required unless the '
+                                               'address is on the loopback interface')
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        from distributed import run_worker
+        run_worker(args.connect, args.authkey, solve_remote_task, args.workers)
+        return
+    if args.command != 'sweep':
+        run_full_analysis()
+        return
+
+    size = args.size or (8 if args.problem == 'queens' else 3)
+    algorithms = args.algorithms or DEFAULT_ALGORITHMS[args.problem]
+    results = run_sweep(args.problem, size, args.count, algorithms, args.seed, args.workers, args.output,
+                        args.options, args.instrument, args.serve, args.authkey, args.lease_time, args.local_workers)
+
+    section_break = '\n' + '_'*100 + '\n'
+    # One aggregator holds every algorithm's results, keyed by algorithm
+    aggregator = ResultAggregator()
+    for algorithm, records in results.items():
+        aggregator.merge(aggregate(records, algorithm))
+    for algorithm in results:
+        print(section_break)
+        print('Results from ' + algorithm + ':\n')
+        print_summary_table(aggregator, algorithm)
+        if all(record['optimal_cost'] is not None for record in results[algorithm]):
+            print_optimal_cost_table(aggregator, algorithm)
+
+
+if __name__ == '__main__':
+    main()
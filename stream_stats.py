@@ -0,0 +1,164 @@
+''' Single-pass statistics for solver results. RunningStats keeps the count, mean and variance (Welford's method),
+minimum and maximum of a stream of values, plus a QuantileSketch for percentiles. Both can be merged, so results
+summarized in separate worker processes can be combined without keeping the values themselves. '''
+
+from math import ceil, log, sqrt
+
+
+class QuantileSketch:
+    ''' Log-bucketed histogram (as in DDSketch or HDR histograms): a value x > 0 is counted in bucket
+    ceil(log(x, gamma)), so any quantile is returned within relative_accuracy of a value in the stream. Values at or
+    below min_value are counted as zero. '''
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = log(self.gamma)
+        self.min_value = min_value
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= self.min_value:
+            self.zero_count += 1
+        else:
+            index = ceil(log(value) / self.log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Only sketches with the same relative accuracy can be merged')
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        ''' Returns the q-quantile (0 <= q <= 1) of the values added, or None if there are none '''
+        if not self.count:
+            return None
+        # Nearest rank: the smallest value with at least q of the values at or below it
+        rank = max(ceil(q * self.count) - 1, 0)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # The middle of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return 2 * self.gamma**max(self.buckets) / (self.gamma + 1)
+
+
+class RunningStats:
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = 0
+        self.m2 = 0          # sum of squared differences from the mean
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        ''' Adds other's values to these statistics (Chan et al.'s pairwise update) and returns self '''
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+            self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def sd(self):
+        ''' Sample standard deviation, 0 for fewer than two values '''
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0
+
+    def quantile(self, q):
+        ''' Estimated q-quantile, clamped to the exact minimum and maximum '''
+        if not self.count:
+            return None
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+    def summary(self):
+        ''' Returns a dict for formatting table rows; an empty stream reports zeros '''
+        if not self.count:
+            return {'count': 0, 'mean': 0, 'sd': 0, 'min': 0, 'max': 0, 'p50': 0, 'p90': 0, 'p99': 0}
+        return {'count': self.count, 'mean': self.mean, 'sd': self.sd, 'min': self.min, 'max': self.max,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+
+class ResultAggregator:
+    ''' Streams solver results into RunningStats per (algorithm, outcome, optimal cost) group and per field. Only
+    numeric fields present in a result are counted, including the counters and phase times in result['stats']. '''
+
+    fields = ('time', 'path_length', 'total_nodes', 'peak_memory', 'bound')
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.groups = {}
+        self.counts = {}
+
+    def add(self, result, algorithm=None):
+        key = (algorithm, result['outcome'], result.get('optimal_cost'))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        group = self.groups.setdefault(key, {})
+        values = [(field, result[field]) for field in self.fields if result.get(field) is not None]
+        values += [('stats.' + name, value) for name, value in result.get('stats', {}).items()]
+        for field, value in values:
+            if field not in group:
+                group[field] = RunningStats(self.relative_accuracy)
+            group[field].add(value)
+
+    def merge(self, other):
+        for key, group in other.groups.items():
+            self.counts[key] = self.counts.get(key, 0) + other.counts[key]
+            own = self.groups.setdefault(key, {})
+            for field, stats in group.items():
+                if field not in own:
+                    own[field] = RunningStats(self.relative_accuracy)
+                own[field].merge(stats)
+        return self
+
+    def matching(self, algorithm=None, outcome=None, optimal_cost=None, success=None):
+        ''' Returns the group keys matching every argument that is given; success=True or False selects outcome ==
+        'success' or any other outcome '''
+        return [key for key in self.groups
+                if (algorithm is None or key[0] == algorithm) and (outcome is None or key[1] == outcome) and
+                (optimal_cost is None or key[2] == optimal_cost) and
+                (success is None or (key[1] == 'success') == success)]
+
+    def select(self, **kwargs):
+        ''' Returns {field: RunningStats} merged over the groups matching kwargs (see matching) '''
+        selected = {}
+        for key in self.matching(**kwargs):
+            for field, stats in self.groups[key].items():
+                if field not in selected:
+                    selected[field] = RunningStats(self.relative_accuracy)
+                selected[field].merge(stats)
+        return selected
+
+    def count(self, **kwargs):
+        return sum(self.counts[key] for key in self.matching(**kwargs))
+
+    def fields_seen(self):
+        return sorted({field for group in self.groups.values() for field in group})
+
+    def optimal_costs(self, algorithm=None):
+        return sorted({key[2] for key in self.matching(algorithm=algorithm) if key[2] is not None})
@@ -0,0 +1,28 @@
+from cache import SolutionCache
+from puzzle import PuzzleProblem, h_manhattan, h_linear_conflict
+from queens import QueensProblem, QueensState, h_num_attacks, h_distinct_attacks
+
+QUEENS = [(column, (2*column) % 8) for column in range(8)]
+START = [1, 2, 3, 4, 5, 6, 9, 7, 8]
+GOAL = list(range(1, 10))
+
+
+def test_puzzle_keys_differ_by_heuristic():
+    assert PuzzleProblem(h_manhattan, START, GOAL).canonical_key() != \
+        PuzzleProblem(h_linear_conflict, START, GOAL).canonical_key()
+
+
+def test_queens_keys_differ_by_heuristic():
+    assert QueensProblem(QueensState(QUEENS), cost_function=h_num_attacks).canonical_key() != \
+        QueensProblem(QueensState(QUEENS), cost_function=h_distinct_attacks).canonical_key()
+
+
+def test_cached_solutions_are_kept_per_heuristic(tmp_path):
+    cache = SolutionCache(str(tmp_path / 'cache.sqlite'))
+    problem = PuzzleProblem(h_manhattan, START, GOAL)
+    path = [problem.start_state] + problem.start_state.get_children()[:1]
+    cache.store('astar', problem, path)
+
+    assert cache.lookup('astar', PuzzleProblem(h_linear_conflict, START, GOAL)) is None
+    cached_path, _ = cache.lookup('astar', PuzzleProblem(h_manhattan, START, GOAL))
+    assert [state.sequence for state in cached_path] == [state.sequence for state in path]
@@ -0,0 +1,36 @@
+import asyncio
+import json
+from server import SolveServer
+
+
+async def exchange(lines):
+    ''' Sends lines to a fresh server, shuts down the sending side and returns the replies '''
+    solve_server = SolveServer(workers=1)
+    await solve_server.start()
+    server = await asyncio.start_server(solve_server.handle_client, '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        writer.write_eof()
+        replies = [json.loads(line) for line in (await asyncio.wait_for(reader.read(), 60)).splitlines()]
+        writer.close()
+        return replies
+    finally:
+        server.close()
+        await solve_server.stop()
+
+
+def test_bad_requests_do_not_affect_valid_ones():
+    goal = list(range(1, 10))
+    lines = ['[1, 2]', 'not json',
+             json.dumps({'id': 1, 'problem': 'puzzle', 'start': [1, 2, 3, 4, 5, 6, 7, 9, 8], 'goal': goal}),
+             json.dumps({'id': 2, 'problem': 'cube'}),
+             json.dumps({'id': 3, 'problem': 'puzzle', 'start': [1, 2, 3, 4, 5, 6, 9, 7, 8], 'goal': goal})]
+    replies = asyncio.run(exchange(lines))
+
+    assert len(replies) == len(lines)
+    by_id = {reply.get('id'): reply for reply in replies}
+    assert by_id[1]['outcome'] == 'success' and by_id[3]['outcome'] == 'success'
+    assert by_id[2]['outcome'] == 'error'
+    # The lines that could not be read as requests are answered without an id
+    assert [reply['outcome'] for reply in replies if 'id' not in reply] == ['error', 'error']
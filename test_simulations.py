@@ -0,0 +1,37 @@
+import socket
+import pytest
+from simulations import DEFAULT_ALGORITHMS, run_sweep
+
+
+@pytest.mark.parametrize('problem_type, size', [('queens', 8), ('puzzle', 3)])
+def test_default_sweep_runs_every_algorithm(tmp_path, problem_type, size):
+    output = str(tmp_path / 'results.jsonl')
+    results = run_sweep(problem_type, size, 2, DEFAULT_ALGORITHMS[problem_type], output=output)
+    assert sorted(results) == DEFAULT_ALGORITHMS[problem_type]
+    for algorithm, records in results.items():
+        assert len(records) == 2, algorithm
+        assert all(record['outcome'] != 'error' for record in records), records
+
+
+def test_sweep_resumes_from_checkpoint(tmp_path, capsys):
+    output = str(tmp_path / 'results.jsonl')
+    first = run_sweep('queens', 8, 3, ['astar'], output=output)
+    capsys.readouterr()
+    second = run_sweep('queens', 8, 3, ['astar'], output=output)
+    assert '3 results loaded' in capsys.readouterr().out
+    assert first == second
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_distributed_sweep_with_process_pools(tmp_path):
+    # One local worker solving with a pool of two processes, like --local-workers 1 --workers 2
+    output = str(tmp_path / 'results.jsonl')
+    results = run_sweep('queens', 8, 4, ['astar', 'steepest_ascent_hill_climb'], workers=2, output=output,
+                        serve='127.0.0.1:' + str(free_port()), local_workers=1)
+    assert all(len(records) == 4 for records in results.values())
+    assert all(record['outcome'] != 'error' for records in results.values() for record in records)